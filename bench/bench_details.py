@@ -0,0 +1,33 @@
+"""
+Route details lookups (`_Details` getters) against the route data in data/route_data/
+"""
+import _common
+import _routestore as store
+from eta import details as dets
+
+def _lookup(row: dict):
+    entry = dict(row)
+    obj = dets._Details.get_obj(entry.pop('eta_co'))(**entry)
+    obj.get_route_name()
+    obj.get_dest()
+    obj.get_orig()
+    # KMB stop names come from a per-route cache downloaded on first use, not from route.json
+    if not isinstance(obj, dets.DetailsKmb):
+        obj.get_stop_name()
+
+def run(repeat: int) -> dict:
+    _common.pin_route_data()
+    results = {}
+    for row in _common.ROWS:
+        co = row['eta_co']
+        results[f"details.lookup.{co}"] = _common.measure(lambda: _lookup(row), repeat, 100)
+        
+        # first lookup after the route file is (re)written: parse + index
+        path = dets._Details.get_obj(co)(**{k: v for k, v in row.items() if k != 'eta_co'}).rte_path
+        def cold():
+            store.invalidate(path)
+            _lookup(row)
+        results[f"details.lookup_cold.{co}"] = _common.measure(cold, repeat)
+    
+    results["details.lookup.all_rows"] = _common.measure(lambda: [_lookup(row) for row in _common.ROWS], repeat, 100)
+    return results
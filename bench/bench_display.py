@@ -0,0 +1,104 @@
+"""
+Epd3in7: drawing, frame buffer conversion, upload to the (simulated) e-Paper module, and the whole refresh
+"""
+import os
+import random
+import shutil
+import tempfile
+import _common
+import _request as rqst
+from PIL import Image
+from apiserver import ApiServer
+from conftest import epd3in7_display
+from display import interface
+from display.waveshare.epd_lib import epdconfig
+from display.waveshare.epd_lib import epd3in7 as epd
+
+def _frame(mode: str) -> Image.Image:
+    """a 4 gray (or 1 bit) frame of random blocks, in panel orientation"""
+    rand = random.Random(0)
+    img = Image.new('L', (epd.EPD_WIDTH, epd.EPD_HEIGHT), 255)
+    for _ in range(200):
+        x, y = rand.randrange(epd.EPD_WIDTH), rand.randrange(epd.EPD_HEIGHT)
+        img.paste(rand.choice((0x00, 0x80, 0xC0, 0xFF)), (x, y, x + rand.randrange(4, 60), y + rand.randrange(4, 30)))
+    return img.convert(mode)
+
+def _upload(repeat: int, func) -> dict:
+    """time `func` on the simulated module, with the simulated hardware time of one call"""
+    sim = epdconfig.implementation
+    result = _common.measure(func, repeat)
+    sim.reset_stats()
+    func()
+    result.update({
+        'sim_ms': round(sim.clock * 1000, 3),
+        'sim_spi_ms': round(sim.spi_time * 1000, 3),
+        'sim_busy_ms': round(sim.busy_time * 1000, 3),
+        'bytes': sim.bytes_sent,
+        'transfers': sim.transfers,
+    })
+    return result
+
+def run(repeat: int, latency: float = 0) -> dict:
+    _common.pin_route_data()
+    if not isinstance(epdconfig.implementation, epdconfig.Simulated):
+        raise RuntimeError("epdconfig is not using the simulated e-Paper module")
+    results = {}
+    driver = epd.EPD()
+    gray4, gray1 = _frame('L'), _frame('1')
+    
+    # frame buffer
+    results["display.getbuffer"] = _common.measure(lambda: driver.getbuffer(gray1), repeat, 10)
+    results["display.getbuffer_4Gray"] = _common.measure(lambda: driver.getbuffer_4Gray(gray4), repeat, 10)
+    results["display.getbuffer_4Gray.rotate90"] = _common.measure(
+        lambda: driver.getbuffer_4Gray(gray4.transpose(Image.Transpose.ROTATE_90), 90), repeat, 10)
+    
+    # upload
+    buf1, buf4 = driver.getbuffer(gray1), driver.getbuffer_4Gray(gray4)
+    driver.init(0)
+    results["upload.display_4Gray"] = _upload(repeat, lambda: driver.display_4Gray(buf4))
+    results["upload.clear_4Gray"] = _upload(repeat, lambda: driver.Clear(0xFF, 0))
+    driver.init(1)
+    results["upload.display_1Gray"] = _upload(repeat, lambda: driver.display_1Gray(buf1))
+    results["upload.display_1Gray_partial.80x40"] = _upload(repeat, lambda: driver.display_1Gray_partial(buf1, 80, 200, 160, 240))
+    
+    # drawing and the whole refresh
+    root = tempfile.mkdtemp(prefix="eta-bench-")
+    server = ApiServer(latency=latency, rebase=True)
+    rqst.configure(base_url=server.start())
+    try:
+        display = epd3in7_display(root, _common.ROWS)
+        try:
+            display.f_route, display.f_text, display.f_time, display.f_mins, display.f_min, display.f_lmins
+        except OSError as e:
+            results["display.draw"] = results["refresh.full_update"] = {'skipped': f"font missing: {e}"}
+            return results
+        
+        results["refresh.fetch"] = _common.measure(display.fetch, repeat)
+        
+        rows = display.fetch()
+        fetch = display.fetch
+        display.fetch = lambda: rows
+        def draw():
+            display.new_frame()
+            display.draw()
+        def draw_cold():
+            display._bg = None
+            display.texts.clear()
+            for fname in os.listdir(os.path.join(root, "tmp")):
+                os.remove(os.path.join(root, "tmp", fname))
+            draw()
+        results["display.draw"] = _common.measure(draw, repeat)
+        results["display.draw_cold"] = _common.measure(draw_cold, repeat)
+        display.fetch = fetch
+        
+        display.init()
+        def refresh():
+            draw()
+            display.full_update(0)
+        results["refresh.full_update"] = _upload(repeat, refresh)
+    finally:
+        server.stop()
+        rqst.configure(base_url="")
+        shutil.rmtree(root, ignore_errors=True)
+        interface.DisplayABC.texts.clear()
+    return results
@@ -0,0 +1,70 @@
+"""
+Benchmarks of one display refresh, split into its stages, with the results printed (or saved) as JSON
+so that they can be compared across commits.
+
+    python3 bench/run.py -o bench.json
+    python3 bench/run.py -s eta display --latency 0.05
+
+Everything runs offline: the API calls go to the stand-in API server (src/eta/apiserver.py)
+and the e-Paper module is simulated (epdconfig.Simulated).
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _common
+import bench_details
+import bench_display
+import bench_eta
+
+SUITES = {
+    'details': lambda args: bench_details.run(args.repeat),
+    'eta': lambda args: bench_eta.run(args.repeat, args.latency),
+    'display': lambda args: bench_display.run(args.repeat, args.latency),
+}
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_common.ROOT, 
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the display refresh")
+    parser.add_argument('-s', '--suite', nargs="+", default=list(SUITES), choices=list(SUITES), dest="suites",
+                        help="Suites to run (Default: all)")
+    parser.add_argument('-r', '--repeat', default=5, type=int, dest="repeat",
+                        help="Number of timed runs of each benchmark (Default: 5)")
+    parser.add_argument('--latency', default=0, type=float, dest="latency",
+                        help="Latency in second of the stand-in API server (Default: 0)")
+    parser.add_argument('-o', '--output', default=None, type=str, dest="output",
+                        help="Save the results to <output> instead of printing them")
+    args = parser.parse_args()
+    
+    output = {
+        'meta': {
+            'commit': _commit(),
+            'time': datetime.datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'latency': args.latency,
+        },
+        'results': {},
+    }
+    for suite in args.suites:
+        output['results'].update(SUITES[suite](args))
+    
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
@@ -2,11 +2,14 @@
 # -*- coding:utf-8 -*-
 import importlib
 import os
+import signal
 import sys
+import time
 import argparse
 from src.config import config
 from src.config import configurator
 from src.log.mylogger import Logger
+from src.log.metrics import metrics
 from src.display.interface import DisplayABC
 from src.eta import details as dets
 
@@ -35,6 +38,8 @@ args_log.add_argument('-l', '--log', action="store_true", dest="log",
                     help="Save the log to file.  Use -L, --log-dir to specify other destination (Default: log/)")
 args_log.add_argument('-L', '--log-dir', default=os.path.join(ROOT, "log"), type=str, dest="dir_log", 
                     help="Specify the directory to save the log.  (Default: log/)")
+args_log.add_argument('--timings', default=None, type=str, dest="path_timings", 
+                    help="Append the time spent in each stage of every refresh to <path> (JSON lines).  The summary is also logged at level [INFO]")
 args_log.add_argument('--log-level', default="warning", type=str.upper, choices=["DEBUG","INFO","WARNING","ERROR","CRITICAL"], dest="log_lv", 
                     help="Specify the log level for both stdout and fout (Default: [WARNING])")
     # partial
@@ -48,6 +53,24 @@ args_partial.add_argument('-t', '--partial-interval', default=60, type=int, dest
                     help="[loop] Update display every <interval> second (Default: 60s)")
 args_partial.add_argument('-C', '--partial-cycle', default=10, type=int, dest="times", 
                     help="[loop] Update <times> times, then exits the program (Default 10 times)")
+    # daemon
+args_daemon = parser.add_argument_group(title="Daemon", 
+                                        description="keep running and refresh the display on a schedule, instead of one update per invocation")
+args_daemon.add_argument('-D', '--daemon', action="store_true", dest="daemon", 
+                    help="Run as a long-running process.  The display, fonts, route data and HTTP connections are kept between refreshes")
+args_daemon.add_argument('-T', '--daemon-interval', default=60, type=int, dest="daemon_intv", 
+                    help="Refresh the display every <interval> second (Default: 60s)")
+args_daemon.add_argument('-P', '--poll-interval', default=0, type=int, dest="poll_intv", 
+                    help="Fetch the ETAs from the APIs every <interval> second only, the minutes are counted down locally in between (Default: 0, on every refresh)")
+args_daemon.add_argument('-A', '--adaptive', action="store_true", dest="adaptive", 
+                    help="Fetch each row often when its next ETA is within 3 minutes and seldom when it is 20+ minutes away or out of service, "
+                         "and refresh the display only when it changes, instead of every <interval> (daemon and loop mode)")
+args_daemon.add_argument('-S', '--stale-after', default=180, type=int, dest="stale_after", 
+                    help="Mark the cached ETAs, shown while the APIs are unreachable, as stale after <seconds> (Default: 180s)")
+args_daemon.add_argument('-M', '--metrics-port', default=None, type=int, dest="metrics_port", 
+                    help="Serve Prometheus metrics at http://<address>:<port>/metrics")
+args_daemon.add_argument('--metrics-address', default="0.0.0.0", type=str, dest="metrics_addr", 
+                    help="Address of the metrics endpoint to listen on (Default: 0.0.0.0)")
 
 
 args = parser.parse_args()
@@ -87,26 +110,35 @@ def obj_setup():
             model = conf['model']
             module = importlib.import_module(f"src.display.{brand}.{model}")
             
-            return getattr(module, "CLS")(ROOT, int(size))
+            display = getattr(module, "CLS")(ROOT, int(size))
+            display.etas.stale_after = args.stale_after
+            display.poll_interval = args.poll_intv
+            display.adaptive = args.adaptive
+            return display
         except Exception as e:
             raise RuntimeError(f"[initialization]: {e}")
 
 def main():
     global epd
-    epd = obj_setup()
+    Logger.begin_refresh()
+    with Logger.span("config"):
+        epd = obj_setup()
     
     if not args.dryrun:
         if args.partial and not epd.can_partial():
             Logger.log.error(f"{epd.__class__.__name__} do not support partial update")
             return
         
-        epd.init()
+        with Logger.span("init"):
+            epd.init()
         # if not args.partial:
-        epd.clear()
+        with Logger.span("clear"):
+            epd.clear()
     
     # get and draw ETA
     Logger.log.info("Drawing ETA information")
-    epd.draw()
+    with Logger.span("draw"):
+        epd.draw()
     
     # update display
     if not args.dryrun: 
@@ -123,8 +155,87 @@ def main():
         Logger.log.info(f"Saving output to {args.path_image}")
         epd.save_image(args.path_image)
     
+    Logger.end_refresh(args.path_timings)
     return 0
 
+def serve_metrics():
+    metrics.describe("eta_station_stage_seconds", "histogram", 
+                     "Time spent in each stage of a refresh (fetch.<operator>, draw, pack, upload, busy, ...), and in the whole refresh")
+    metrics.describe("eta_station_refreshes_total", "counter", "Refreshes by result (ok, error)")
+    metrics.describe("eta_station_eta_errors_total", "counter", "ETA rows not shown by operator and exception type")
+    metrics.describe("eta_station_background_total", "counter", "Static layer lookups by source (memory, disk, render)")
+    metrics.describe("eta_station_text_cache_total", "counter", "Text render cache lookups by result (hit, miss)")
+    Logger.listen(lambda name, seconds: metrics.observe("eta_station_stage_seconds", seconds, stage=name))
+    Logger.log.info(f"Serving metrics at {metrics.serve(args.metrics_addr, args.metrics_port)}")
+
+def daemon():
+    global epd
+    display = obj_setup()
+    if args.metrics_port is not None:
+        serve_metrics()
+    cleared = False
+    shown = None
+    start = time.monotonic()
+    cycle = 0
+    
+    while True:
+        Logger.begin_refresh()
+        result = "error"
+        try:
+            # route data is checked once per day, the date is kept only once it is updated, 
+            # a failed update (e.g. network error) is retried on the next refresh and the old data is shown meanwhile
+            today = time.strftime('%Y%m%d')
+            if today != dets._Details.get_today():
+                previous = dets._Details.get_today()
+                dets._Details.set_today(today)
+                try:
+                    dets._Details.update_all()
+                except Exception as e:
+                    dets._Details.set_today(previous)
+                    Logger.log.error(f"Failed to update the route data: {e}", exc_info=1)
+            
+            Logger.log.info("Drawing ETA information")
+            display.new_frame()
+            with Logger.span("draw"):
+                display.draw()
+            frame = display.img.tobytes()
+            
+            if args.adaptive and frame == shown:
+                Logger.log.info("Nothing changed, the display is not updated")
+            elif not args.dryrun:
+                with Logger.span("init"):
+                    display.init()
+                epd = display
+                if not cleared:
+                    with Logger.span("clear"):
+                        display.clear()
+                    cleared = True
+                
+                Logger.log.info(f"Displaying output to e-paper display")
+                display.full_update(args.degree)
+                display.exit()
+                epd = None
+            
+            if args.dryrun or args.image_out: 
+                Logger.log.info(f"Saving output to {args.path_image}")
+                display.save_image(args.path_image)
+            shown = frame
+            result = "ok"
+        except Exception as e:
+            # keep running, the next refresh may succeed
+            Logger.log.error(f"Error occurrs during refresh: {e}", exc_info=1)
+        Logger.end_refresh(args.path_timings)
+        metrics.inc("eta_station_refreshes_total", result=result)
+        
+        if args.adaptive:
+            time.sleep(max(0, display.next_wake() - time.monotonic()))
+        else:
+            cycle += 1
+            time.sleep(max(0, start + cycle * args.daemon_intv - time.monotonic()))
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt()
+
 
 if __name__=='__main__':
     try:
@@ -139,7 +250,11 @@ if __name__=='__main__':
             if args.verbose:
                 Logger.verbose(getattr(Logger, args.log_lv))
                 Logger.log.info(f"Log level is set to {args.log_lv}")
-            main()
+            if args.daemon:
+                signal.signal(signal.SIGTERM, _terminate)
+                daemon()
+            else:
+                main()
         else:
             configurator.Configurator(ROOT)
     except KeyboardInterrupt:
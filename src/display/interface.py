@@ -1,11 +1,98 @@
 import os
 import sys
 import string
+import hashlib
+import json
+import threading
+import time
+import concurrent.futures
 from abc import ABC, abstractmethod
-from PIL import ImageFont
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)))) # src path
 from src.config import config
 from src.log.mylogger import Logger
+from src.log.metrics import metrics
+from eta import details as dets
+from eta import eta
+import _request as rqst
+from etacache import EtaCache
+
+_fonts = {}
+_fonts_lock = threading.Lock()
+
+def font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """get the font `path` in `size`, opened on first use and shared by every display
+
+    Raises:
+        OSError: font file do not exists or cannot be read
+    """
+    key = (os.path.abspath(path), size)
+    with _fonts_lock:
+        if key not in _fonts:
+            Logger.log.debug(f"Loading font {os.path.basename(path)} ({size})")
+            _fonts[key] = ImageFont.truetype(path, size)
+        return _fonts[key]
+
+
+class Row(NamedTuple):
+    """a row of the display, as resolved by `DisplayABC.fetch()`"""
+    details: dets._Details
+    eta: eta.Eta
+
+
+class TextCache:
+    """bounded LRU cache of rendered text, keyed by (font, size, text, image mode).  
+    ETAs are drawn from a small set of strings (minutes, HH:MM, "分"), 
+    so a refresh mostly pastes bitmaps instead of shaping and rasterizing them again
+    """
+    
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+    
+    def get(self, text: str, font: ImageFont.FreeTypeFont, mode: str) -> tuple:
+        """get the rendered `text`
+
+        Returns:
+            tuple: `(offset, mask)`, offset of the mask from the text origin and 
+            the mask (`None` for text with no visible pixel)
+        """
+        key = (getattr(font, "path", id(font)), getattr(font, "size", None), text, mode)
+        if key in self._cache:
+            self.hits += 1
+            metrics.inc("eta_station_text_cache_total", result="hit")
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        
+        self.misses += 1
+        metrics.inc("eta_station_text_cache_total", result="miss")
+        # sized and placed like ImageDraw.text() does, from the mask of the glyphs (getbbox() may cut off their ink), 
+        # and drawn the same way, i.e. no anti-aliasing on 1-bit images
+        core, (left, top) = font.getmask2(text, mode)
+        width, height = core.size
+        if width == 0 or height == 0:
+            rendered = ((0, 0), None)
+        else:
+            mask = Image.new(mode, (width, height), 0)
+            ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+            rendered = ((left, top), mask)
+        
+        self._cache[key] = rendered
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return rendered
+    
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
+
 
 class DisplayABC:
     
@@ -17,6 +104,17 @@ class DisplayABC:
     
     LAYOUT: dict
     logger = Logger.log
+    texts = TextCache()
+    fetch_wait = 3  # second to wait for the ETAs before showing the cached ones
+    poll_interval = 0   # second between fetches from the APIs, 0 to fetch on every draw
+    
+    # adaptive polling, see `poll_delay()`
+    adaptive = False
+    poll_soon = 20      # second between fetches of a row with an ETA within `soon_mins`
+    poll_normal = 60
+    poll_far = 300      # second between fetches of a row with no ETA within `far_mins`, or out of service
+    soon_mins = 3
+    far_mins = 20
     
     def __init__(self, root: str, size: int) -> None:
         self.logger.debug(f"Initializing class {self.__class__.__name__}")
@@ -40,22 +138,236 @@ class DisplayABC:
         self.logger.debug("reading epd.conf")
         self.conf = config.get(os.path.join(root, "conf", "eta.json"))
         
-        # font
-        self.logger.debug("setting up font")
-        font_dir = os.path.join(root, "font")
-        self.f_route = ImageFont.truetype(os.path.join(font_dir, "NotoSansTC-Black.otf"), self.lyo['f_route'])
-        self.f_text = ImageFont.truetype(os.path.join(font_dir, "msjh.ttc"), self.lyo['f_text'])
-        self.f_time = ImageFont.truetype(os.path.join(font_dir, "agencyb.tff"), self.lyo['f_time'])
-        self.f_mins = ImageFont.truetype(os.path.join(font_dir, "GenJyuuGothic-Monospace-Medium.ttf"), self.lyo['f_mins'])
-        self.f_min = ImageFont.truetype(os.path.join(font_dir, "GenJyuuGothic-Monospace-Regular.ttf"), self.lyo['f_min'])
-        self.f_lmins = ImageFont.truetype(os.path.join(font_dir, "GenJyuuGothic-Monospace-Medium.ttf"), self.lyo['f_lmins'])
+        # font, loaded on first use
+        self.font_dir = os.path.join(root, "font")
+        
+        # last successful ETAs of each row
+        self.etas = EtaCache(os.path.join(root, "tmp", "eta_cache.json"))
+        self._refresh: concurrent.futures.Future = None
+        self._rows = {}     # cache key -> last `Row`
+        self._due = {}      # cache key -> time.monotonic() of the next fetch of the row
+        self._fetching = set()  # cache key of the rows in the refresh in flight
+        self._refresher = ThreadPoolExecutor(max_workers=1)
+    
+    @property
+    def f_route(self):
+        return font(os.path.join(self.font_dir, "NotoSansTC-Black.otf"), self.lyo['f_route'])
+    
+    @property
+    def f_text(self):
+        return font(os.path.join(self.font_dir, "msjh.ttc"), self.lyo['f_text'])
+    
+    @property
+    def f_time(self):
+        return font(os.path.join(self.font_dir, "agencyb.tff"), self.lyo['f_time'])
+    
+    @property
+    def f_mins(self):
+        return font(os.path.join(self.font_dir, "GenJyuuGothic-Monospace-Medium.ttf"), self.lyo['f_mins'])
+    
+    @property
+    def f_min(self):
+        return font(os.path.join(self.font_dir, "GenJyuuGothic-Monospace-Regular.ttf"), self.lyo['f_min'])
+    
+    @property
+    def f_lmins(self):
+        return font(os.path.join(self.font_dir, "GenJyuuGothic-Monospace-Medium.ttf"), self.lyo['f_lmins'])
     
     def can_partial(self) -> bool:
         return self.partial
 
+    def new_frame(self):
+        """discard the drawn output and start over on a blank (white) image"""
+        self.img = Image.new(self.img.mode, self.img.size, 255)
+        self.drawing = ImageDraw.Draw(self.img)
+
     def set_mode(self, mode):
         self.mode = mode
     
+    def fetch(self) -> list:
+        """resolve the details and ETAs of every row in eta.json concurrently, 
+        so a refresh costs about one API round trip instead of one per row.  
+        
+        If the ETAs of every row are cached, the refresh is waited for `fetch_wait` second at most,  
+        then the cached ETAs are shown while it completes in the background (stale-while-revalidate).  
+        Rows failing to refresh (e.g. network error) show their cached ETAs as well.  
+        
+        Only the rows due for a fetch (see `poll_delay()`) call the APIs, the others are returned as last fetched 
+        and their ETAs count the minutes down to the time of drawing (`eta.Eta.get_etas()`)
+
+        Returns:
+            list: `Row` of each row, in row order
+        """
+        entries = self.conf[:self.row_size]
+        if len(self.conf) > self.row_size:
+            self.logger.warning(f"Number of ETA entry in eta.conf ({len(self.conf)}) is larger than allowed display number.  Stoped at {self.row_size}.")
+        if len(entries) == 0:
+            return []
+        
+        with Logger.span("fetch"):
+            keys = [self.etas.key(entry) for entry in entries]
+            # a refresh still in flight is waited for, instead of starting another one
+            if self._refresh is None or self._refresh.done():
+                now = time.monotonic()
+                due = [entry for entry, key in zip(entries, keys) 
+                       if key not in self._fetching and now >= self._due.get(key, 0)]
+                if len(due) > 0:
+                    self._fetching.update(self.etas.key(entry) for entry in due)
+                    self._refresh = self._refresher.submit(self._fetch_all, due)
+            
+            if self._refresh is not None and not self._refresh.done():
+                cached = all(key in self._rows or self.etas.has(key) for key in keys)
+                try:
+                    self._refresh.result(timeout=self.fetch_wait if cached else None)
+                except concurrent.futures.TimeoutError:
+                    self.logger.warning(f"ETAs are not fetched in {self.fetch_wait}s, showing the cached ones")
+            return [self._rows.get(key) or Row(self._details(entry), self.etas.get(key)) for entry, key in zip(entries, keys)]
+    
+    def _fetch_all(self, entries: list):
+        # rows sharing an upstream call (e.g. same KMB route) download it only once
+        try:
+            with rqst.coalescing(), ThreadPoolExecutor(max_workers=len(entries)) as pool:
+                list(pool.map(self._fetch_row, entries))
+            self.etas.save()
+        finally:
+            self._fetching.difference_update(self.etas.key(entry) for entry in entries)
+    
+    def poll_delay(self, _eta: eta.Eta) -> float:
+        """get the time to the next fetch of a row, from its latest ETAs.  
+        With `adaptive`, a row is fetched every `poll_soon` second when its next ETA is within `soon_mins`, 
+        and every `poll_far` second when it is `far_mins` or more away, or the service has ended.  
+        Otherwise every `poll_interval` second
+
+        Returns:
+            float: second to the next fetch
+        """
+        if not self.adaptive:
+            return self.poll_interval
+        if _eta.error:
+            return self.poll_far if _eta.error_type == "EndOfService" else self.poll_normal
+        
+        etas = _eta.get_etas()
+        mins = [e.eta_mins for e in etas if isinstance(e.eta_mins, int)]
+        if len(etas) == 0:
+            return self.poll_normal
+        elif len(mins) < len(etas) or min(mins) < self.soon_mins:
+            # "arriving" notes, or due within minutes
+            return self.poll_soon
+        elif min(mins) >= self.far_mins:
+            return self.poll_far
+        return self.poll_normal
+    
+    def next_wake(self) -> float:
+        """get the next time the display may change: a row is due for a fetch, or the minutes of an ETA count down.  
+        Rows being fetched are not due, their refresh is shown on the next wake.  
+        It is `poll_soon` second from now at the earliest, so nothing to wait for (e.g. no row) or 
+        a row failing to fetch does not refresh the display continuously
+
+        Returns:
+            float: `time.monotonic()` of the change
+        """
+        clock, now = time.monotonic(), datetime.now()
+        wake = min((due for key, due in list(self._due.items()) if key not in self._fetching), default=clock)
+        # copied, the refresh may add rows meanwhile
+        for _dets, _eta in list(self._rows.values()):
+            if not _eta.error:
+                # the minutes count down a whole minute after the fetch, and every minute since
+                wake = min(wake, clock + 60 - (now - _eta.fetched_at).total_seconds() % 60)
+        return max(wake, clock + self.poll_soon)
+    
+    def _details(self, entry: dict):
+        entry = dict(entry)
+        co = entry.pop('eta_co')
+        with Logger.span("details"):
+            return dets._Details.get_obj(co)(**entry)
+    
+    def _fetch_row(self, entry: dict) -> Row:
+        key = self.etas.key(entry)
+        entry = dict(entry)
+        co = entry.pop('eta_co')
+        self.logger.debug(f"- Reading entry {entry}")
+        details = self._details({'eta_co': co, **entry})
+        with Logger.span(f"fetch.{co}"):
+            _eta = eta.Eta.get_obj(co)(**entry)
+        
+        if not _eta.error:
+            self.etas.put(key, _eta)
+        else:
+            metrics.inc("eta_station_eta_errors_total", operator=co, error=_eta.error_type)
+            cached = self.etas.get(key) if _eta.transient else None
+            if cached is not None:
+                self.logger.warning(f"Failed to fetch the ETAs of {entry} ({_eta.error_type}), showing the cached ones")
+                _eta = cached
+        
+        self._rows[key] = Row(details, _eta)
+        self._due[key] = time.monotonic() + self.poll_delay(_eta)
+        return self._rows[key]
+    
+    def background(self, rows: list) -> Image.Image:
+        """get the static layer of the display (frame, route titles), which changes with the titles only.  
+        It is rendered by `draw_background()` once, then cached in memory and in tmp/ 
+        under a hash of the layout and the titles shown.  
+        Titles failed to resolve ("err", e.g. the KMB stop cache is not built yet) are not saved to tmp/, 
+        so they are retried once the route data is available
+
+        Args:
+            rows (list): `Row` of each row, from `fetch()`
+        """
+        titles = [[_dets.get_route_name(), _dets.get_dest(), _dets.get_stop_name()] for _dets, _eta in rows]
+        key = hashlib.sha1(json.dumps(
+            [self.__class__.__name__, self.img.mode, self.img.size, self.lyo, titles], 
+            sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        
+        if getattr(self, "_bg", None) is not None and self._bg[0] == key:
+            metrics.inc("eta_station_background_total", result="memory")
+            return self._bg[1]
+        
+        path = os.path.join(self.root, "tmp", f"bg-{self.__class__.__name__}-{key}.bmp")
+        if os.path.exists(path):
+            self.logger.debug(f"Loading the background from {path}")
+            metrics.inc("eta_station_background_total", result="disk")
+            img = Image.open(path).convert(self.img.mode)
+        else:
+            metrics.inc("eta_station_background_total", result="render")
+            self.logger.debug("Drawing the background")
+            img = Image.new(self.img.mode, self.img.size, 255)
+            with Logger.span("draw.background"):
+                self.draw_background(ImageDraw.Draw(img), rows)
+            if not any("err" in row for row in titles):
+                self._save_background(img, path)
+        
+        self._bg = (key, img)
+        return img
+    
+    def _save_background(self, img: Image.Image, path: str):
+        try:
+            img.save(path)
+        except OSError as e:
+            self.logger.warning(f"Failed to save the background to {path}: {e}")
+            return
+        # the previous backgrounds are not shown again, until eta.json or the route data change back
+        prefix = f"bg-{self.__class__.__name__}-"
+        for name in os.listdir(os.path.dirname(path)):
+            if name.startswith(prefix) and name.endswith(".bmp") and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(os.path.dirname(path), name))
+                except OSError:
+                    pass
+    
+    def draw_background(self, drawing: ImageDraw.ImageDraw, rows: list):
+        """draw the static layer of the display, see `background()`"""
+        pass
+    
+    def text(self, xy: tuple, text: str, fill: int, font: ImageFont.FreeTypeFont):
+        """same as `ImageDraw.text()` on the output image, rendered through `texts`"""
+        if "\n" in text:
+            # multiline text is laid out by ImageDraw
+            self.drawing.text(xy, text, fill=fill, font=font)
+            return
+        (left, top), mask = self.texts.get(text, font, "1" if self.img.mode == "1" else "L")
+        if mask is not None:
+            self.img.paste(fill, (int(xy[0]) + left, int(xy[1]) + top), mask)
+    
     def _dotted(self, text: str, max: int):
         only_text = text.translate(str.maketrans('', '', string.punctuation)).replace(" ", "")
         offset = len(text) - len(only_text)
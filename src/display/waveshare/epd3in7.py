@@ -2,12 +2,12 @@ import os
 import string
 import sys
 import time
+from datetime import datetime
 from PIL import Image,ImageDraw,ImageFont
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))) # src path
 from display.interface import DisplayABC
+from src.log.mylogger import Logger
 from display.waveshare.epd_lib import epd3in7 as epd
-from eta import details as dets
-from eta import eta
 
 PARTIAL = True
 MAXROW = 6
@@ -104,7 +104,16 @@ class Epd3in7(DisplayABC):
         
     def full_update(self, deg: int):
         super().full_update(deg)
-        self.epd.display_4Gray(self.epd.getbuffer_4Gray(self.img.rotate(deg)))
+        with Logger.span("pack"):
+            buf = self.epd.getbuffer_4Gray(self.img, deg)
+        self._upload(self.epd.display_4Gray, buf)
+
+    def _upload(self, send, *args):
+        # time spent sending the frame, with the part of it waiting for the panel (BUSY) on its own
+        busy = self.epd.busy_time
+        with Logger.span("upload"):
+            send(*args)
+        Logger.record("busy", self.epd.busy_time - busy)
 
     @staticmethod
     def can_partial():
@@ -113,81 +122,120 @@ class Epd3in7(DisplayABC):
     def partial_update(self, deg: int, intv: int, times: int, mode: str, img_path: str):
         if mode == "loop":
             # loop mode
+            # the panel sleeps between updates, on wake-up the frame on the display is written back 
+            # to its RAM without a refresh, then only the changed window has to be sent
             super().full_update(deg)
             self.full_update(deg)
+            self.exit()
+            prev_buf = self.epd.getbuffer(self.img, deg)
+            start = time.time()
             while times > 1:
-                self.exit()
-                end = time.time()
-                time.sleep(intv - (end - start))
+                if self.adaptive:
+                    # until a row is due for a fetch or a minute shown counts down
+                    time.sleep(max(0, self.next_wake() - time.monotonic()))
+                else:
+                    time.sleep(max(0, intv - (time.time() - start)))
                 start = time.time()
-                super().partial_update(deg, intv, times)
-                prev_img = self.img
-                self.img = Image.new('1', (self.epd_width, self.epd_height), 255)
-                self.drawing = ImageDraw.Draw(self.img)
+                super().partial_update(deg, intv, times, mode, img_path)
+                self.new_frame()
+                with Logger.span("draw"):
+                    self.draw()
                 
-                self.init()
-                self.epd.display_1Gray(self.epd.getbuffer(prev_img.rotate(deg)))
-                self.draw()
-                self.epd.display_1Gray(self.epd.getbuffer(self.img.rotate(deg)))
+                with Logger.span("pack"):
+                    buf = self.epd.getbuffer(self.img, deg)
+                if self._dirty_window(prev_buf, buf) is None:
+                    self.logger.debug("Nothing changed, the display is not woken up")
+                else:
+                    with Logger.span("init"):
+                        self.init()
+                    self._upload(self.epd.write_1Gray, prev_buf)
+                    self._display_changes(prev_buf, buf)
+                    self.exit()
+                prev_buf = buf
                 
                 times -= 1
         elif mode == "normal":
             # normal mode
             if os.path.exists(img_path):
-                prev_img = Image.open(img_path)
-                self.epd.display_1Gray(self.epd.getbuffer(prev_img.rotate(deg)))
+                prev_buf = self.epd.getbuffer(Image.open(img_path), deg)
+                self.epd.display_1Gray(prev_buf)
                 time.sleep(1)
-                self.epd.display_1Gray(self.epd.getbuffer(self.img.rotate(deg)))
+                self._display_changes(prev_buf, self.epd.getbuffer(self.img, deg))
             else:
                 self.logger.error("Image file for partial update do not exists.  No update is done.\n\
                     Please check the path or do a full update with flag -i first (optional: -I <path> to specify the path)")
 
-    def draw(self):
-        super().draw()
+    def _dirty_window(self, prev: bytes, buf: bytes) -> tuple | None:
+        """find the area where two frame buffers differ
+
+        Returns:
+            tuple | None: `(x_start, y_start, x_end, y_end)` in panel pixels with x aligned to bytes, None if identical
+        """
+        line = self.epd.width // 8
+        rows = [y for y in range(self.epd.height) if prev[y*line:(y+1)*line] != buf[y*line:(y+1)*line]]
+        if len(rows) == 0:
+            return None
+        cols = [x for y in rows for x in range(line) if prev[y*line + x] != buf[y*line + x]]
+        return (min(cols) * 8, rows[0], (max(cols) + 1) * 8, rows[-1] + 1)
+    
+    def _display_changes(self, prev: bytes, buf: bytes):
+        """send the part of `buf` that differs from `prev` (the frame on the display) only"""
+        window = self._dirty_window(prev, buf)
+        if window is None:
+            self.logger.debug("Nothing changed, the display is not updated")
+        else:
+            self.logger.debug(f"Updating window {window}")
+            self._upload(self.epd.display_1Gray_partial, buf, *window)
+
+    def draw_background(self, drawing: ImageDraw.ImageDraw, rows: list):
         # Frame
         self.logger.debug("Drawing the layout")
         for row in range(self.row_size):
-            self.drawing.line((0, self.row_h * (row+1), self.epd_height, 80 * (row+1)))
+            drawing.line((0, self.row_h * (row+1), self.epd_height, 80 * (row+1)))
         
-        # ETA
-        self.logger.debug("Drawing ETA(s)")
-        for row, entry in enumerate(self.conf):
-            co = entry['eta_co']
-            del entry['eta_co']
-            
-            if  self.row_size <= row: 
-                self.logger.warning(f"Number of ETA entry in eta.conf ({len(self.conf)}) is larger than allowed display number.  Stoped at {row}.")
-                break
-            
-            self.logger.debug(f"- Reading entry {entry}")
-            _dets = dets._Details.get_obj(co)(**entry)
-            _eta = eta.Eta.get_obj(co)(**entry)
-            
+        for row, (_dets, _eta) in enumerate(rows):
             rte = _dets.get_route_name()
             dest = self._dotted(_dets.get_dest(), 9)
             stop = self._dotted(_dets.get_stop_name(), 9)
             
             # titles
             self.logger.debug(f"- Drawing row {row}'s route information")
-            self.drawing.text((5, (self.row_h*row + -5)), text=rte, fill=self.black, font=self.f_route)
-            self.drawing.text((5, (self.row_h*row + 35)), dest, fill=self.black, font=self.f_text)
-            self.drawing.text((5, (self.row_h*row + 55)), f"@{stop}", fill=self.black, font=self.f_text)
-            
+            drawing.text((5, (self.row_h*row + -5)), text=rte, fill=self.black, font=self.f_route)
+            drawing.text((5, (self.row_h*row + 35)), dest, fill=self.black, font=self.f_text)
+            drawing.text((5, (self.row_h*row + 55)), f"@{stop}", fill=self.black, font=self.f_text)
+
+    def draw(self):
+        super().draw()
+        rows = self.fetch()
+        self.img.paste(self.background(rows))
+        
+        # ETA, the minutes are counted to the same time for every row
+        self.logger.debug("Drawing ETA(s)")
+        now = datetime.now()
+        for row, (_dets, _eta) in enumerate(rows):
             # time
             self.logger.debug(f"- Drawing row {row}'s ETA time")
+            if getattr(_eta, 'stale', False):
+                # cached ETAs, the latest refresh of this row failed
+                self.text((self.epd_width - 15, self.row_h*row + 2), text="*", fill=self.black, font=self.f_text)
+            etas = [] if _eta.error else _eta.get_etas(now)
             if _eta.error:
-                self.drawing.text((170, self.row_h*row + 25), text=_eta.msg, fill=self.black, font=self.f_text)
+                self.text((170, self.row_h*row + 25), text=_eta.msg, fill=self.black, font=self.f_text)
+            elif len(etas) == 0:
+                # every ETA fetched has departed since
+                self.text((170, self.row_h*row + 25), text="沒有數據", fill=self.black, font=self.f_text)
             else:
-                for idx, time in enumerate(_eta.get_etas()):
+                for idx, time in enumerate(etas):
                     if (idx < self.num_etas):
-                        eta_mins = str(time['eta_mins'])
+                        eta_mins = str(time.eta_mins)
                         if len(eta_mins) <= 3 :
-                            self.drawing.text((self.lyo['etax'], self.lyo['etay'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=eta_mins, fill=self.black, font=self.f_mins)
-                            self.drawing.text((self.lyo['minx'], self.lyo['miny'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=self.lyo['min_desc'], fill=self.black, font=self.f_min)
-                            self.drawing.text((self.lyo['timex'], self.lyo['timey'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=time['eta_time'], fill=self.black, font=self.f_time)
+                            self.text((self.lyo['etax'], self.lyo['etay'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=eta_mins, fill=self.black, font=self.f_mins)
+                            self.text((self.lyo['minx'], self.lyo['miny'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=self.lyo['min_desc'], fill=self.black, font=self.f_min)
+                            self.text((self.lyo['timex'], self.lyo['timey'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=time.eta_time, fill=self.black, font=self.f_time)
                         else:
-                            self.drawing.text((self.lyo['lminx'], self.lyo['lminy'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=eta_mins, fill=self.black, font=self.f_lmins)
+                            self.text((self.lyo['lminx'], self.lyo['lminy'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=eta_mins, fill=self.black, font=self.f_lmins)
                     else: break
+        self.logger.debug(f"Text cache: {self.texts.hits} hits, {self.texts.misses} misses")
 
 
 CLS = Epd3in7
\ No newline at end of file
@@ -5,8 +5,6 @@ import sys
 from PIL import Image,ImageDraw,ImageFont
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))) # lib path
 from display.interface import DisplayABC
-from eta import details as dets
-from eta import eta
 
 EPD_WIDTH       = 280
 EPD_HEIGHT      = 480
@@ -108,18 +106,8 @@ class Epd3in7(DisplayABC):
         
         # ETA
         self.logger.debug("Drawing ETA(s)")
-        for row, entry in enumerate(self.conf):
-            co = entry['eta_co']
-            del entry['eta_co']
-            
-            if  self.row_size <= row: 
-                self.logger.warning(f"Number of ETA entry in eta.conf ({len(self.conf)}) is larger than allowed display number.  Stoped at {row}.")
-                break
+        for row, (_dets, _eta) in enumerate(self.fetch()):
             self.logger.debug(f"----- Row {row} -----")
-            self.logger.debug(f"Reading entry {str(entry)}")
-            
-            _dets = dets._Details.get_obj(co)(**entry)
-            _eta = eta.Eta.get_obj(co)(**entry)
             
             rte = _dets.get_route_name()
             dest = self._dotted(_dets.get_dest(), 9)
@@ -140,11 +128,11 @@ class Epd3in7(DisplayABC):
                 for idx, time in enumerate(_eta.get_etas()):
                     if (idx < self.num_etas):
                         self.logger.debug(time)
-                        eta_mins = str(time['eta_mins'])
+                        eta_mins = str(time.eta_mins)
                         if len(eta_mins) <= 3 :
                             self.drawing.text((self.lyo['etax'], self.lyo['etay'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=eta_mins, fill=self.black, font=self.f_mins)
                             self.drawing.text((self.lyo['minx'], self.lyo['miny'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=self.lyo['min_desc'], fill=self.black, font=self.f_min)
-                            self.drawing.text((self.lyo['timex'], self.lyo['timey'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=time['eta_time'], fill=self.black, font=self.f_time)
+                            self.drawing.text((self.lyo['timex'], self.lyo['timey'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=time.eta_time, fill=self.black, font=self.f_time)
                         else:
                             self.drawing.text((self.lyo['lminx'], self.lyo['lminy'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=eta_mins, fill=self.black, font=self.f_lmins)
                     else: break
@@ -5,8 +5,6 @@ from PIL import Image,ImageDraw,ImageFont
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))) # lib path
 # sys.path.append(os.path.dirname(__file__)) # waveshare path
 import epd3in7_debug
-from eta import details as dets
-from eta import eta
 
 # layout
 S_ROW = 8
@@ -57,13 +55,7 @@ class Epd3in7(epd3in7_debug.Epd3in7):
         for row in range(5):
             self.drawing.line((0, self.row_h * (row+1), EPD_HEIGHT, 80 * (row+1)))
         
-        for row, entry in enumerate(self.conf):
-            co = entry['eta_co']
-            del entry['eta_co']
-                       
-            _dets = dets._Details.get_obj(co)(**entry)
-            _eta = eta.Eta.get_obj(co)(**entry)
-            
+        for row, (_dets, _eta) in enumerate(self.fetch()):
             # route
             rte = _dets.get_route_name()
             dest = self._dotted(_dets.get_dest(), 9)
@@ -83,9 +75,9 @@ class Epd3in7(epd3in7_debug.Epd3in7):
             else:
                 for idx, time in enumerate(_eta.get_etas()):
                     if (idx < self.num_etas):
-                        eta_mins = str(time['eta_mins'])
+                        eta_mins = str(time.eta_mins)
                         if len(eta_mins) <= 3 :
-                            self.drawing.text((self.lyo['timex'], self.lyo['timey'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=time['eta_time'], fill=GRAY4, font=self.f_time)
+                            self.drawing.text((self.lyo['timex'], self.lyo['timey'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=time.eta_time, fill=GRAY4, font=self.f_time)
                             #self.drawing.text((self.lyo['etax'], self.lyo['etay'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=eta_mins, fill=GRAY4, font=self.f_mins)
                             #self.drawing.text((self.lyo['minsx'], self.lyo['minsy'] + (self.row_h*row + self.lyo['eta_pad']*idx)), text=self.lyo['min_desc'], fill=GRAY4, font=self.f_min)
                         else:
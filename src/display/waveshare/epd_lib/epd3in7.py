@@ -28,6 +28,7 @@
 #
 
 import logging
+from PIL import Image
 from . import epdconfig
 
 # Display resolution
@@ -41,6 +42,49 @@ GRAY4  = 0x00 #black
 
 logger = logging.getLogger(__name__)
 
+def _gray4_level(pixel):
+    # 0xC0 (close to white) -> 0x80, 0x80 (close to black) -> 0x40, keep the highest 2 bits
+    if(pixel == 0xC0):
+        pixel = 0x80
+    elif(pixel == 0x80):
+        pixel = 0x40
+    return (pixel & 0xC0) >> 6
+
+# translation tables of 8 bit gray pixel -> 2 bit gray shifted to the n-th pixel of a byte
+_GRAY4_LANES = [bytes(_gray4_level(p) << (6 - 2*lane) for p in range(256)) for lane in range(4)]
+
+def _gray4_plane_nibble(byte, plane):
+    # 4 pixels of 2 bit gray -> 4 bits of RAM plane 0x24 / 0x26, first pixel in the highest bit
+    #   0x24: white(0xC0) 1, gray2(0x40) 1, gray1(0x80) 0, black(0x00) 0
+    #   0x26: white(0xC0) 1, gray1(0x80) 1, gray2(0x40) 0, black(0x00) 0
+    nibble = 0
+    for k in range(4):
+        level = (byte >> (6 - 2*k)) & 0x03
+        bit = level & 0x01 if plane == 0x24 else level >> 1
+        nibble = (nibble << 1) | bit
+    return nibble
+
+# translation tables of 2 bit gray buffer byte -> RAM plane nibble, [0] high nibble, [1] low nibble
+_GRAY4_PLANES = {
+    plane: [bytes(_gray4_plane_nibble(b, plane) << 4 for b in range(256)),
+            bytes(_gray4_plane_nibble(b, plane) for b in range(256))]
+    for plane in (0x24, 0x26)
+}
+
+# counter-clockwise quarter turns -> transpose method
+_ROTATE = {
+    1: Image.Transpose.ROTATE_90,
+    2: Image.Transpose.ROTATE_180,
+    3: Image.Transpose.ROTATE_270,
+}
+
+def _merge_lanes(lanes, size):
+    # OR equally sized byte strings together, bytewise
+    merged = 0
+    for lane in lanes:
+        merged |= int.from_bytes(lane, 'big')
+    return bytearray(merged.to_bytes(size, 'big'))
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -53,6 +97,7 @@ class EPD:
         self.GRAY2  = GRAY2
         self.GRAY3  = GRAY3 #gray
         self.GRAY4  = GRAY4 #Blackest
+        self.busy_time = 0  # total time spent waiting for BUSY, in second
 
     lut_4Gray_GC = [
         0x2A,0x06,0x15,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -133,12 +178,18 @@ class EPD:
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    def send_data_bulk(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(10) 
-        logger.debug("e-Paper busy release") 
+        busy_time = epdconfig.wait_busy(self.busy_pin, 1)      #  0: idle, 1: busy
+        self.busy_time += busy_time
+        logger.debug("e-Paper busy release (%d ms)", busy_time * 1000)
 
 
     def init(self, mode):
@@ -235,70 +286,67 @@ class EPD:
 
     def load_lut(self, lut):
         self.send_command(0x32)
-        for i in range(0, 105):
-            self.send_data(lut[i])
-
-
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
+        self.send_data_bulk(lut[0:105])
+
+
+    def _orientate(self, image, deg, mode):
+        # rotate `image` counter-clockwise by `deg` like Image.rotate(deg) (same size, no expand),
+        # convert it to `mode` and turn it into the panel orientation
+        # a half turn is done with the orientation in a single transpose, unless the conversion dithers
+        # (to '1'), which depends on the pixel order
+        # return None if the image does not fit the panel in either orientation
+        turns = 0
+        if(deg % 360 == 180 and (mode == 'L' or image.mode == '1')):
+            turns = 2
+        elif(deg % 360 != 0):
+            # a quarter turn of a non-square image crops it and fills the corners black
+            image = image.rotate(deg)
+        image = image.convert(mode)
+        imwidth, imheight = image.size
         # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
         if(imwidth == self.width and imheight == self.height):
             logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
         elif(imwidth == self.height and imheight == self.width):
             logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+            turns = (turns + 1) % 4
+        else:
+            return None
+        if(turns != 0):
+            image = image.transpose(_ROTATE[turns])
+        return image
 
 
-    def getbuffer_4Gray(self, image):
+    def getbuffer(self, image, deg=0):
         # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i = i + 1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = imwidth - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i = i + 1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        return buf
+        image_monocolor = self._orientate(image, deg, '1')
+        if(image_monocolor is None):
+            return bytearray([0xFF] * (int(self.width/8) * self.height))
+        # mode '1' is already packed MSB first, 1 bit per pixel (1: white, 0: black)
+        return bytearray(image_monocolor.tobytes())
+
+
+    def getbuffer_4Gray(self, image, deg=0):
+        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
+        image_monocolor = self._orientate(image, deg, 'L')
+        if(image_monocolor is None):
+            return bytearray([0xFF] * (int(self.width / 4) * self.height))
+        return self._pack_4Gray(image_monocolor.tobytes())
+
+
+    @staticmethod
+    def _pack_4Gray(pixels):
+        # pack 4 pixels of 8 bit gray into 1 byte of 2 bit gray, first pixel in the highest bits
+        # each pixel lane is translated to its 2 bit value already shifted into place,
+        # then the 4 lanes are OR-ed together as big integers
+        return _merge_lanes([pixels[lane::4].translate(_GRAY4_LANES[lane]) for lane in range(4)], len(pixels) // 4)
+
+
+    @staticmethod
+    def _encode_4Gray(image, plane):
+        # every 2 bytes of the 2 bit gray buffer (8 pixels) make up 1 byte of RAM plane 0x24 / 0x26
+        image = bytes(image)
+        high, low = _GRAY4_PLANES[plane]
+        return _merge_lanes([image[0::2].translate(high), image[1::2].translate(low)], len(image) // 2)
 
 
     def display_4Gray(self, image):
@@ -313,35 +361,7 @@ class EPD:
         self.send_data(0x00)
 
         self.send_command(0x24)
-        for i in range(0, (int)(self.height*(self.width/8))):
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01           #white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00           #black
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00           #gray1
-                    else:                       #0x40
-                        temp3 |= 0x01           #gray2
-                    temp3 <<= 1
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):          #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00):        #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00           #gray1
-                    else:                       #0x40
-                        temp3 |= 0x01           #gray2
-                    if(j!=1 or k!=1):
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
+        self.send_data_bulk(self._encode_4Gray(image, 0x24))
 
         self.send_command(0x4E)
         self.send_data(0x00)
@@ -351,35 +371,7 @@ class EPD:
         self.send_data(0x00)
 
         self.send_command(0x26)
-        for i in range(0, (int)(self.height*(self.width/8))):
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01       #white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00       #black
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01       #gray1
-                    else:                   #0x40
-                        temp3 |= 0x00       #gray2
-                    temp3 <<= 1
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):      #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00):    #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01       #gray1
-                    else:                   #0x40
-                        temp3 |= 0x00       #gray2
-                    if(j!=1 or k!=1):
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
+        self.send_data_bulk(self._encode_4Gray(image, 0x26))
 
         self.load_lut(self.lut_4Gray_GC)
         self.send_command(0x22)
@@ -400,15 +392,69 @@ class EPD:
         self.send_data(0x00)
 
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, int(self.width / 8)):
-                self.send_data(image[i + j * int(self.width / 8)])   
+        self.send_data_bulk(image[0:int(self.width / 8) * self.height])
 
         self.load_lut(self.lut_1Gray_A2)
         self.send_command(0x20)
         self.ReadBusy()   
         
 
+    def write_1Gray(self, image):
+        # write a frame buffer to RAM 0x24 without refreshing the panel,
+        # e.g. the frame on the display after waking up, before a partial update
+        if (image == None):
+            return            
+
+        self.send_command(0x4E)
+        self.send_data(0x00)
+        self.send_data(0x00)
+        self.send_command(0x4F)
+        self.send_data(0x00)
+        self.send_data(0x00)
+
+        self.send_command(0x24)
+        self.send_data_bulk(image[0:int(self.width / 8) * self.height])
+
+
+    def display_1Gray_partial(self, image, x_start, y_start, x_end, y_end):
+        # update the window [x_start, x_end) x [y_start, y_end) only, `image` is still the whole frame buffer
+        # x_start, x_end must be multiples of 8
+        if (image == None):
+            return            
+
+        line = int(self.width / 8)
+        self.set_window(x_start, y_start, x_end - 1, y_end - 1)
+        self.send_command(0x24)
+        self.send_data_bulk(b''.join(image[y*line + x_start//8 : y*line + x_end//8] for y in range(y_start, y_end)))
+
+        self.load_lut(self.lut_1Gray_A2)
+        self.send_command(0x20)
+        self.ReadBusy()
+        # back to full screen for the following updates
+        self.set_window(0, 0, self.width - 1, self.height - 1)
+
+
+    def set_window(self, x_start, y_start, x_end, y_end):
+        self.send_command(0x44) # setting X direction start/end position of RAM
+        self.send_data(x_start & 0xFF)
+        self.send_data((x_start >> 8) & 0x03)
+        self.send_data(x_end & 0xFF)
+        self.send_data((x_end >> 8) & 0x03)
+
+        self.send_command(0x45) # setting Y direction start/end position of RAM
+        self.send_data(y_start & 0xFF)
+        self.send_data((y_start >> 8) & 0x03)
+        self.send_data(y_end & 0xFF)
+        self.send_data((y_end >> 8) & 0x03)
+
+        self.send_command(0x4E) # RAM X address counter
+        self.send_data(x_start & 0xFF)
+        self.send_data((x_start >> 8) & 0x03)
+        self.send_command(0x4F) # RAM Y address counter
+        self.send_data(y_start & 0xFF)
+        self.send_data((y_start >> 8) & 0x03)
+
+
     def Clear(self, color, mode):
         self.send_command(0x4E)
         self.send_data(0x00)
@@ -417,16 +463,13 @@ class EPD:
         self.send_data(0x00)
         self.send_data(0x00)
 
+        buf = [0xff] * (int(self.width / 8) * self.height)
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, int(self.width / 8)):
-                self.send_data(0xff)   
+        self.send_data_bulk(buf)
 
         if(mode == 0):              #4Gray
             self.send_command(0x26)
-            for j in range(0, self.height):
-                for i in range(0, int(self.width / 8)):
-                    self.send_data(0xff) 
+            self.send_data_bulk(buf)
             self.load_lut(self.lut_4Gray_GC)
             self.send_command(0x22)
             self.send_data(0xC7)
@@ -34,6 +34,88 @@ import time
 
 logger = logging.getLogger(__name__)
 
+# spidev rejects a single transfer larger than its kernel buffer (bufsiz, 4096 by default)
+SPI_BUFSIZ_PATH = '/sys/module/spidev/parameters/bufsiz'
+SPI_BUFSIZ = 4096
+
+
+def spi_bufsiz():
+    try:
+        with open(SPI_BUFSIZ_PATH, 'r') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return SPI_BUFSIZ
+
+# longest refresh of the supported panels (7 colors) is well below a minute
+BUSY_TIMEOUT_MS = 60000
+# upper bound of a single edge wait, the level is checked again after each of them
+BUSY_POLL_MS = 100
+
+
+def wait_for_level(GPIO, pin, busy, timeout_ms):
+    # sleep on the GPIO edge until `pin` leaves the `busy` level instead of polling it
+    # return the time spent waiting in second, raise TimeoutError after `timeout_ms`
+    start = time.monotonic()
+    deadline = start + timeout_ms / 1000.0
+    edge = GPIO.FALLING if busy == 1 else GPIO.RISING
+    while(GPIO.input(pin) == busy):
+        remaining = int((deadline - time.monotonic()) * 1000)
+        if remaining <= 0:
+            raise TimeoutError(f"e-Paper busy for more than {timeout_ms} ms")
+        # the edge may fire between input() and wait_for_edge(), hence the bounded wait
+        try:
+            GPIO.wait_for_edge(pin, edge, timeout=min(remaining, BUSY_POLL_MS))
+        except RuntimeError:
+            # edge detection unavailable (e.g. already in use), fall back to polling
+            time.sleep(min(remaining, 10) / 1000.0)
+    return time.monotonic() - start
+
+
+class FakeGPIO:
+    """
+    RPi.GPIO stand-in for running the drivers off-device.
+    Outputs are recorded in `pins`, BUSY stays at `busy_level` for `busy_ms` after every `trigger_busy()`
+    """
+    BCM = 11
+    OUT = 0
+    IN = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, busy_pin=24, busy_level=1, busy_ms=0):
+        self.pins = {}
+        self.busy_pin = busy_pin
+        self.busy_level = busy_level
+        self.busy_ms = busy_ms
+        self._busy_until = 0.0
+
+    def trigger_busy(self, busy_ms=None):
+        self._busy_until = time.monotonic() + (self.busy_ms if busy_ms is None else busy_ms) / 1000.0
+
+    def setmode(self, mode): pass
+
+    def setwarnings(self, flag): pass
+
+    def setup(self, pin, direction): self.pins.setdefault(pin, 0)
+
+    def output(self, pin, value): self.pins[pin] = value
+
+    def input(self, pin):
+        if pin == self.busy_pin:
+            return self.busy_level if time.monotonic() < self._busy_until else 1 - self.busy_level
+        return self.pins.get(pin, 0)
+
+    def wait_for_edge(self, pin, edge, timeout=None):
+        wait = max(0.0, self._busy_until - time.monotonic())
+        if timeout is not None and wait > timeout / 1000.0:
+            time.sleep(timeout / 1000.0)
+            return None
+        time.sleep(wait)
+        return pin
+
+    def cleanup(self, pins=None): pass
+
 
 class RaspberryPi:
     # Pin definition
@@ -42,12 +124,17 @@ class RaspberryPi:
     CS_PIN          = 8
     BUSY_PIN        = 24
 
-    def __init__(self):
-        import spidev
-        import RPi.GPIO
+    def __init__(self, GPIO=None, SPI=None):
+        if GPIO is None:
+            import RPi.GPIO
+            GPIO = RPi.GPIO
+        if SPI is None:
+            import spidev
+            SPI = spidev.SpiDev()
 
-        self.GPIO = RPi.GPIO
-        self.SPI = spidev.SpiDev()
+        self.GPIO = GPIO
+        self.SPI = SPI
+        self.bufsiz = spi_bufsiz()
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -58,11 +145,17 @@ class RaspberryPi:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, pin, busy=1, timeout_ms=BUSY_TIMEOUT_MS):
+        return wait_for_level(self.GPIO, pin, busy, timeout_ms)
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        # stream the whole buffer, one transfer per spidev buffer sized chunk
+        data = bytes(data)
+        for i in range(0, len(data), self.bufsiz):
+            self.SPI.writebytes2(data[i:i + self.bufsiz])
 
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
@@ -124,9 +217,17 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, pin, busy=1, timeout_ms=BUSY_TIMEOUT_MS):
+        return wait_for_level(self.GPIO, self.BUSY_PIN, busy, timeout_ms)
+
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
+    def spi_writebyte2(self, data):
+        # software SPI, no bulk transfer available
+        for byte in data:
+            self.SPI.SYSFS_software_spi_transfer(byte)
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -148,13 +249,208 @@ class JetsonNano:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN])
 
 
-if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
+class Simulated:
+    """
+    Off-device stand-in for the e-Paper module, for benchmarks and byte-exact regression tests of the drivers.
+
+    Every command and its data are recorded in `commands` as `(command, bytearray)`.
+    Time is simulated rather than spent (unless `realtime`): SPI transfers at `spi_hz` plus `transfer_us`
+    per transfer, `delay_ms()`, and BUSY for `busy_ms[command]` after each command listed there.
+    The RAM writes (0x24 / 0x26) of SSD16xx style controllers are applied to `ram`, see `image()`.
+    """
+    # Pin definition
+    RST_PIN         = 17
+    DC_PIN          = 25
+    CS_PIN          = 8
+    BUSY_PIN        = 24
+
+    # rough BUSY duration in ms of the slow commands: SW reset, auto write RAM, master activation
+    BUSY_MS = {0x12: 10, 0x46: 15, 0x47: 15, 0x20: 1500}
+
+    def __init__(self, width=280, height=480, spi_hz=4000000, transfer_us=10, busy_ms=None,
+                 busy_level=1, bufsiz=SPI_BUFSIZ, realtime=False):
+        self.width = width
+        self.height = height
+        self.spi_hz = spi_hz
+        self.transfer_us = transfer_us
+        self.busy_ms = dict(self.BUSY_MS if busy_ms is None else busy_ms)
+        self.busy_level = busy_level    # level of BUSY while busy, 1 for SSD16xx, 0 for UC81xx
+        self.bufsiz = bufsiz
+        self.realtime = realtime
+        self.pins = {}
+        self.ram = {0x24: bytearray([0xFF] * (width // 8 * height)),
+                    0x26: bytearray([0xFF] * (width // 8 * height))}
+        self.reset_stats()
+        self._reset_controller()
+
+    def reset_stats(self):
+        # discard the recorded commands and zero the counters and the clock
+        self.commands = []
+        self.clock = 0.0        # simulated time in second
+        self.spi_time = 0.0
+        self.busy_time = 0.0
+        self.delay_time = 0.0
+        self.bytes_sent = 0
+        self.transfers = 0
+        self.refreshes = 0
+        self._busy_until = 0.0
+
+    def _reset_controller(self):
+        self._pending = None    # (command, data) still receiving data
+        self._entry = 0x03
+        self._window = (0, 0, self.width - 1, self.height - 1)
+        self._cursor = (0, 0)
+        self._x = self._y = 0
+
+    def digital_write(self, pin, value):
+        self.pins[pin] = value
+        if(pin == self.RST_PIN and value == 0):
+            self._reset_controller()
+
+    def digital_read(self, pin):
+        if(pin == self.BUSY_PIN):
+            # polling loops take as long as BUSY lasts, account for it at once
+            self._wait()
+            return 1 - self.busy_level
+        return self.pins.get(pin, 0)
+
+    def delay_ms(self, delaytime):
+        self._advance(delaytime / 1000.0)
+        self.delay_time += delaytime / 1000.0
+
+    def wait_busy(self, pin, busy=1, timeout_ms=BUSY_TIMEOUT_MS):
+        waited = self._wait()
+        if(waited * 1000 > timeout_ms):
+            raise TimeoutError(f"e-Paper busy for more than {timeout_ms} ms")
+        return waited
+
+    def spi_writebyte(self, data):
+        self._transfer(bytes(data))
+
+    def spi_writebyte2(self, data):
+        data = bytes(data)
+        for i in range(0, len(data), self.bufsiz):
+            self._transfer(data[i:i + self.bufsiz])
+
+    def module_init(self):
+        return 0
+
+    def module_exit(self):
+        self.pins[self.RST_PIN] = 0
+        self.pins[self.DC_PIN] = 0
+
+    def image(self, plane=0x24):
+        # RAM plane as a 1 bit image (1: white, 0: black), in panel orientation
+        from PIL import Image
+        return Image.frombytes('1', (self.width, self.height), bytes(self.ram[plane]))
+
+    def image_4Gray(self):
+        # both RAM planes as a 4 gray image, 0x24 holds the low bit and 0x26 the high bit of each pixel
+        from PIL import Image
+        low = self.image(0x24).convert('L').tobytes()
+        high = self.image(0x26).convert('L').tobytes()
+        # black 0x00, 0x80 (low bit only), 0xC0 (high bit only), white 0xFF
+        levels = bytes([0x00, 0x80, 0xC0, 0xFF] * 64)
+        pixels = bytes((l & 0x01) | (h & 0x02) for l, h in zip(low, high)).translate(levels)
+        return Image.frombytes('L', (self.width, self.height), pixels)
+
+    def _advance(self, seconds):
+        self.clock += seconds
+        if(self.realtime and seconds > 0):
+            time.sleep(seconds)
+
+    def _wait(self):
+        waited = max(0.0, self._busy_until - self.clock)
+        self._advance(waited)
+        self.busy_time += waited
+        return waited
+
+    def _transfer(self, data):
+        seconds = len(data) * 8 / self.spi_hz + self.transfer_us / 1000000.0
+        self._advance(seconds)
+        self.spi_time += seconds
+        self.bytes_sent += len(data)
+        self.transfers += 1
+        if(self.pins.get(self.DC_PIN, 0) == 0):
+            for cmd in data:
+                self._command(cmd)
+        else:
+            self._data(data)
+
+    def _command(self, cmd):
+        if(self._pending is not None):
+            self._apply(*self._pending)
+        if(cmd == 0x12):
+            self._reset_controller()
+        self._pending = (cmd, bytearray())
+        self.commands.append(self._pending)
+        if(cmd == 0x20):
+            self.refreshes += 1
+        elif(cmd in (0x24, 0x26)):
+            self._x, self._y = self._cursor
+        if(cmd in self.busy_ms):
+            self._busy_until = self.clock + self.busy_ms[cmd] / 1000.0
+
+    def _data(self, data):
+        if(self._pending is None):
+            return
+        cmd, received = self._pending
+        received.extend(data)
+        if(cmd in (0x24, 0x26)):
+            self._write_ram(self.ram[cmd], data)
+
+    def _apply(self, cmd, data):
+        # settings take effect once all their data is sent
+        if(cmd == 0x11 and len(data) >= 1):
+            self._entry = data[0]
+        elif(cmd == 0x44 and len(data) >= 4):      # X in pixels, 2 bytes each
+            self._window = (data[0] | data[1] << 8, self._window[1], data[2] | data[3] << 8, self._window[3])
+        elif(cmd == 0x44 and len(data) >= 2):      # X in bytes
+            self._window = (data[0] * 8, self._window[1], data[1] * 8 + 7, self._window[3])
+        elif(cmd == 0x45 and len(data) >= 4):
+            self._window = (self._window[0], data[0] | data[1] << 8, self._window[2], data[2] | data[3] << 8)
+        elif(cmd == 0x4E and len(data) >= 2):
+            self._cursor = (data[0] | data[1] << 8, self._cursor[1])
+        elif(cmd == 0x4E and len(data) == 1):
+            self._cursor = (data[0] * 8, self._cursor[1])
+        elif(cmd == 0x4F and len(data) >= 2):
+            self._cursor = (self._cursor[0], data[0] | data[1] << 8)
+
+    def _write_ram(self, ram, data):
+        # address counter moves along X first, in the direction set by the data entry mode (0x11)
+        xs, ys, xe, ye = self._window
+        x_step = 8 if self._entry & 0x01 else -8
+        y_step = 1 if self._entry & 0x02 else -1
+        stride = self.width // 8
+        for byte in data:
+            if(0 <= self._x < self.width and 0 <= self._y < self.height):
+                ram[self._y * stride + self._x // 8] = byte
+            self._x += x_step
+            if(self._x > xe or self._x < xs):
+                self._x = xs if x_step > 0 else xe
+                self._y += y_step
+                if(self._y > ye or self._y < ys):
+                    self._y = ys if y_step > 0 else ye
+
+
+def use(impl):
+    # route the module level functions to `impl`, e.g. epdconfig.use(epdconfig.Simulated())
+    global implementation
+    implementation = impl
+    for func in [x for x in dir(implementation) if not x.startswith('_')]:
+        setattr(sys.modules[__name__], func, getattr(implementation, func))
+
+
+if os.environ.get('EPD_SIMULATED'):
+    # only on request, a missing module must not pass for a working display
+    logger.warning("EPD_SIMULATED is set, using the simulated e-Paper module")
+    implementation = Simulated()
+elif os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
     implementation = RaspberryPi()
 else:
     implementation = JetsonNano()
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+use(implementation)
 
 
 ### END OF FILE ###
@@ -1,8 +1,127 @@
 from typing import Literal
+from concurrent.futures import Future
+import atexit
+import contextlib
+import functools
+import os
+import threading
+import urllib.parse
 import requests, json
+from requests.adapters import HTTPAdapter
+
+# deadline in second for every API call, so that a stalled endpoint cannot hold up the whole refresh
+TIMEOUT = 10
+# number of keep-alive connections kept per host
+POOL_SIZE = 8
+# send every ETA API call to this server instead, e.g. "http://127.0.0.1:8000" for the stand-in API server (apiserver.py).  
+# https://data.etabus.gov.hk/v1/... is then requested as http://127.0.0.1:8000/data.etabus.gov.hk/v1/...  
+# Route and stop data are still downloaded from the operators, only the ETA responses are recorded
+BASE_URL = os.environ.get("ETA_API_BASE_URL") or None
+
+_session: requests.Session = None
+_session_lock = threading.Lock()
+
+def session() -> requests.Session:
+    '''
+    Get the shared HTTP session.  Connections are kept alive and pooled per host,
+    so consecutive calls to data.etabus.gov.hk / rt.data.gov.hk skip the TCP + TLS handshake
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def configure(pool_size: int = None, timeout: float = None, base_url: str = None):
+    '''
+    Change the connection pool size, the timeout and/or the base URL (see `BASE_URL`) of the API calls.  
+    The current session is closed and recreated on next use
+    '''
+    global POOL_SIZE, TIMEOUT, BASE_URL
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if timeout is not None:
+        TIMEOUT = timeout
+    if base_url is not None:
+        BASE_URL = base_url.rstrip("/") or None
+    close()
+
+def _url(url: str) -> str:
+    '''
+    Get the URL to request for `url` of an ETA API, redirected to `BASE_URL` if set
+    '''
+    if BASE_URL is None:
+        return url
+    parts = urllib.parse.urlsplit(url)
+    return f"{BASE_URL.rstrip('/')}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+def close():
+    '''
+    Close the shared HTTP session and all its pooled connections
+    '''
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+atexit.register(close)
+
+# {(function, args): Future} of the calls made in the current coalescing block, None when not coalescing
+_calls: dict = None
+_calls_lock = threading.Lock()
+
+@contextlib.contextmanager
+def coalescing():
+    '''
+    Within the block, identical ETA calls (same endpoint and parameters) are sent once 
+    and the response is shared by every caller, including concurrent ones.  
+    Intended to span one refresh; the returned data must be treated as read-only
+
+    e.g. two rows on the same KMB route download the route-wide ETA only once
+    '''
+    global _calls
+    with _calls_lock:
+        outermost = _calls is None
+        if outermost:
+            _calls = {}
+    try:
+        yield
+    finally:
+        if outermost:
+            with _calls_lock:
+                _calls = None
+
+def _coalesced(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        owner = False
+        with _calls_lock:
+            if _calls is None:
+                future = None
+            elif key in _calls:
+                future = _calls[key]
+            else:
+                future = _calls[key] = Future()
+                owner = True
+        
+        if future is None:
+            return func(*args, **kwargs)
+        if owner:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+    return wrapper
 
 # -------------------- eta --------------------
 
+@_coalesced
 def kmb_eta(route: str, services_type: int) -> dict: 
     '''
     Get KMB ETA data by route from https://data.gov.hk/en-data/dataset/hk-td-tis_21-etakmb/resource/3604afb8-b2c2-4d47-a637-dfab77fc4d72
@@ -14,12 +133,13 @@ def kmb_eta(route: str, services_type: int) -> dict:
     '''
 
     url = "https://data.etabus.gov.hk/v1/transport/kmb/route-eta/{r}/{t}".format(r=route,t=services_type)
-    response = requests.get(url)
+    response = session().get(_url(url), timeout=TIMEOUT)
     response.raise_for_status()
     data = json.loads(response.text)
 
     return data
 
+@_coalesced
 def mtr_bus_eta(route: str, lang: Literal["zh", "en"]) -> dict:
     '''
     Get MTR bus eta by route from https://data.gov.hk/en-data/dataset/mtr-mtr_bus-mtr-bus-eta-data/resource/44cba19e-56fe-49b8-b1a0-29b0fb2ef433
@@ -32,12 +152,13 @@ def mtr_bus_eta(route: str, lang: Literal["zh", "en"]) -> dict:
 
     data = {"language":lang, "routeName":route}
     url = "https://rt.data.gov.hk/v1/transport/mtr/bus/getSchedule"
-    response = requests.post(url, json=data)
+    response = session().post(_url(url), json=data, timeout=TIMEOUT)
     response.raise_for_status()
     data = json.loads(response.text)
 
     return data
     
+@_coalesced
 def mtr_lrt_eta(stop: int) -> dict:
     '''
     Get MTR LRT eta by station from https://data.gov.hk/en-data/dataset/mtr-lrnt_data-light-rail-nexttrain-data/resource/e9cee6d8-4b12-4a0f-8d09-5924dd2db218
@@ -51,12 +172,13 @@ def mtr_lrt_eta(stop: int) -> dict:
     params = {"station_id": stop}
     headers = {}
     url = "https://rt.data.gov.hk/v1/transport/mtr/lrt/getSchedule"
-    response = requests.get(url, params=params, headers=headers)
+    response = session().get(_url(url), params=params, headers=headers, timeout=TIMEOUT)
     response.raise_for_status()
     data = json.loads(response.text)
 
     return data
 
+@_coalesced
 def mtr_train_eta(route: str, stop: str, lang: Literal["TC", "EN"]) -> dict:
     '''
     Get MTR LRT eta by route and station from https://data.gov.hk/en-data/dataset/mtr-data2-nexttrain-data/resource/744cd43f-4f0d-4f58-b244-78486efc68eb
@@ -69,7 +191,7 @@ def mtr_train_eta(route: str, stop: str, lang: Literal["TC", "EN"]) -> dict:
 
     params = {"line": route, "sta":stop, "lang": lang}
     url = "https://rt.data.gov.hk/v1/transport/mtr/getSchedule.php"
-    response = requests.get(url, params=params)
+    response = session().get(_url(url), params=params, timeout=TIMEOUT)
     response.raise_for_status()
     data = json.loads(response.text)
 
@@ -85,11 +207,10 @@ def mtr_bus_stop_detail() -> list:
     '''
 
     url = "https://opendata.mtr.com.hk/data/mtr_bus_stops.csv"
-    with requests.Session() as s:
-        data = s.get(url)
-        data = data.content.decode("utf-8")
-        lines = data.splitlines()
-        return lines
+    response = session().get(url, timeout=TIMEOUT)
+    data = response.content.decode("utf-8")
+    lines = data.splitlines()
+    return lines
 
 def mtr_bus_route_detail() -> list: 
     '''
@@ -99,11 +220,10 @@ def mtr_bus_route_detail() -> list:
     '''
 
     url = "https://opendata.mtr.com.hk/data/mtr_bus_routes.csv"
-    with requests.Session() as s:
-        data = s.get(url)
-        data = data.content.decode("utf-8")
-        lines = data.splitlines()
-        return lines
+    response = session().get(url, timeout=TIMEOUT)
+    data = response.content.decode("utf-8")
+    lines = data.splitlines()
+    return lines
 
 def mtr_lrt_route_stop_detail() -> list: 
     '''
@@ -113,11 +233,10 @@ def mtr_lrt_route_stop_detail() -> list:
     '''
 
     url = "https://opendata.mtr.com.hk/data/light_rail_routes_and_stops.csv"
-    with requests.Session() as s:
-        data = s.get(url)
-        data = data.content.decode("utf-8")
-        lines = data.splitlines()
-        return lines
+    response = session().get(url, timeout=TIMEOUT)
+    data = response.content.decode("utf-8")
+    lines = data.splitlines()
+    return lines
 
 def kmb_route_detail() -> dict:
     '''
@@ -130,7 +249,7 @@ def kmb_route_detail() -> dict:
     '''
 
     url = "https://data.etabus.gov.hk/v1/transport/kmb/route/"
-    response = requests.get(url)
+    response = session().get(url, timeout=TIMEOUT)
     response.raise_for_status()
     data = json.loads(response.text)
 
@@ -147,7 +266,7 @@ def kmb_route_stop_detail(route: str, dir: Literal["inbound", "outbound"], servi
     '''
 
     url = "https://data.etabus.gov.hk/v1/transport/kmb/route-stop/{rt}/{dir}/{st}".format(rt=route,dir=dir,st=services_type)
-    response = requests.get(url)
+    response = session().get(url, timeout=TIMEOUT)
     response.raise_for_status()
     data = json.loads(response.text)
 
@@ -164,7 +283,24 @@ def kmb_stop_detail(stop_id: str) -> dict:
     '''
 
     url = "https://data.etabus.gov.hk/v1/transport/kmb/stop/{id}".format(id=stop_id)
-    response = requests.get(url)
+    response = session().get(url, timeout=TIMEOUT)
+    response.raise_for_status()
+    data = json.loads(response.text)
+
+    return data
+
+def kmb_stop_list() -> dict:
+    '''
+    Get the details of every KMB stop from https://data.gov.hk/en-data/dataset/hk-td-tis_21-etakmb/resource/8f60fda1-5720-4dbc-a41f-fa1e20b9b35e
+
+    Details: https://data.gov.hk/en-data/dataset/hk-td-tis_21-etakmb
+
+    @Exception
+    - HTTPError
+    '''
+
+    url = "https://data.etabus.gov.hk/v1/transport/kmb/stop"
+    response = session().get(url, timeout=TIMEOUT)
     response.raise_for_status()
     data = json.loads(response.text)
 
@@ -177,11 +313,8 @@ def mtr_train_route_stop_detail() -> list:
     Details: https://data.gov.hk/tc-data/dataset/mtr-data-routes-fares-barrier-free-facilities/resource/771d42e4-057d-4b4d-ae9e-08dbdf9ac371
     '''
     url = "https://opendata.mtr.com.hk/data/mtr_lines_and_stations.csv"
-    response = requests.get(url)
+    response = session().get(url, timeout=TIMEOUT)
     response.raise_for_status()
-    
-    with requests.Session() as s:
-        data = s.get(url)
-        data = data.content.decode("utf-8")
-        lines = data.splitlines()
-        return lines
\ No newline at end of file
+    data = response.content.decode("utf-8")
+    lines = data.splitlines()
+    return lines
\ No newline at end of file
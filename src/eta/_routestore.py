@@ -0,0 +1,61 @@
+"""
+Process-wide store of the route data files (`route.json` of each company, KMB stop caches).
+
+Each file is parsed once and kept in memory, together with the lookup indexes built from it,
+until the code rewriting the file invalidates it (`Details.update()`, `DetailsKmb.cache()`).
+It also holds the date the route data is checked against, `today()`
+"""
+import datetime
+import json
+import os
+import threading
+
+_lock = threading.RLock()
+_files: dict = {}     # path -> parsed file
+_indexes: dict = {}   # (path, index name) -> index
+_today = datetime.date.today().strftime('%Y%m%d')
+
+def load(path: str) -> dict | list:
+    """get the parsed content of a JSON file, read from disk on first use only
+
+    Raises:
+        FileNotFoundError: file do not exists
+    """
+    path = os.path.abspath(path)
+    with _lock:
+        if path not in _files:
+            with open(path, "r", encoding="utf-8") as f:
+                _files[path] = json.load(f)
+        return _files[path]
+
+def index(path: str, name: str, build) -> dict:
+    """get the index `name` of a route file, built by `build(data)` on first use
+
+    Args:
+        path (str): path to the route file
+        name (str): name of the index
+        build (callable): build the index from the `data` of the route file
+    """
+    path = os.path.abspath(path)
+    with _lock:
+        key = (path, name)
+        if key not in _indexes:
+            _indexes[key] = build(load(path)['data'])
+        return _indexes[key]
+
+def invalidate(path: str):
+    """drop a file and its indexes, the next lookup reads it again"""
+    path = os.path.abspath(path)
+    with _lock:
+        _files.pop(path, None)
+        for key in [k for k in _indexes if k[0] == path]:
+            del _indexes[key]
+
+def today() -> str:
+    """get the date of the route data, `%Y%m%d`"""
+    return _today
+
+def set_today(today: str):
+    """set the date of the route data, `%Y%m%d`"""
+    global _today
+    _today = today
@@ -0,0 +1,260 @@
+"""
+Offline stand-in for the ETA APIs (data.etabus.gov.hk, rt.data.gov.hk).
+
+Recorded responses are replayed from `data/fixtures/api/<host>/<path>[@<params>].json`,
+e.g. `data.etabus.gov.hk/v1/transport/kmb/route-eta/1/1.json` or
+`rt.data.gov.hk/v1/transport/mtr/lrt/getSchedule@station_id=1.json`.
+A response without `@<params>` is served for any parameters of that path.
+
+Point the ETA calls of `_request` to it with the environment variable `ETA_API_BASE_URL` 
+(or `_request.configure(base_url=...)`). Route and stop data are not recorded, they are still downloaded
+from the operators when outdated:
+
+    python3 src/eta/apiserver.py --latency 0.2 --error-rate 0.1 &
+    ETA_API_BASE_URL=http://127.0.0.1:8000 python3 main.py -d
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+Logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+FIXTURES = os.path.join(ROOT, "data", "fixtures", "api")
+
+# timestamp formats used by the APIs, see `ApiServer.rebase`
+_TIME_FORMATS = (
+    (re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\+08:00"), "%Y-%m-%dT%H:%M:%S+08:00"),
+    (re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d"), "%Y-%m-%d %H:%M:%S"),
+    (re.compile(r"\d{4}/\d\d/\d\d \d\d:\d\d"), "%Y/%m/%d %H:%M"),
+)
+# key of the server time in the response of each API
+_SERVER_TIME = ("generated_timestamp", "system_time", "sys_time", "routeStatusTime")
+
+
+class ApiServer:
+    """replay the recorded API responses over HTTP
+
+    Args:
+        fixtures (str): directory of the recorded responses
+        latency (float): delay in second before every response
+        jitter (float): random extra delay in second, up to `jitter`
+        error_rate (float): fraction (0-1) of the requests answered with `error_status`
+        error_status (int): HTTP status of the failed requests
+        payload_scale (int): repeat every top-level list of the responses `payload_scale` times
+        rebase (bool): shift the timestamps of the responses, as if they were recorded just now
+        record (bool): forward the requests without recorded response to the real API and record them
+    """
+
+    def __init__(self, fixtures: str = FIXTURES, latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, error_status: int = 500, payload_scale: int = 1,
+                 rebase: bool = False, record: bool = False) -> None:
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.payload_scale = payload_scale
+        self.rebase = rebase
+        self.record = record
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._httpd: ThreadingHTTPServer = None
+        self._thread: threading.Thread = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """serve in a background thread
+
+        Args:
+            port (int): 0 for any free port
+
+        Returns:
+            str: base URL of the server, for `_request.configure(base_url=...)`
+        """
+        self._httpd = self._bind(host, port)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 8000):
+        self._httpd = self._bind(host, port)
+        Logger.info(f"Serving {self.fixtures} at {self.url}")
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread = self._httpd = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _bind(self, host: str, port: int) -> ThreadingHTTPServer:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, do not hold the body back for the ACK of the headers
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._handle(self, "GET", None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                server._handle(self, "POST", self.rfile.read(length))
+
+            def log_message(self, format, *args):
+                Logger.debug(format % args)
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        return httpd
+
+    def fixture(self, path: str, params: dict) -> str:
+        """get the path to the recorded response of an API call, None if it is not recorded
+
+        Args:
+            path (str): `<host>/<path>` of the API
+            params (dict): query string or JSON body of the call
+        """
+        base = os.path.join(self.fixtures, *path.strip("/").split("/"))
+        candidates = [base + ".json"]
+        if params:
+            candidates.insert(0, f"{base}@{urllib.parse.urlencode(sorted(params.items()))}.json")
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str, body: bytes):
+        with self._lock:
+            self.requests += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        url = urllib.parse.urlsplit(handler.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if body:
+            try:
+                params.update({k: str(v) for k, v in json.loads(body).items()})
+            except (ValueError, AttributeError):
+                pass
+
+        if random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return self._reply(handler, self.error_status, b'{"message": "simulated error"}')
+
+        path = self.fixture(url.path, params)
+        if path is None and self.record:
+            try:
+                path = self._record(url, method, body, params)
+            except OSError as e:
+                Logger.warning(f"Failed to record {url.path}: {e}")
+        if path is None:
+            Logger.warning(f"No recorded response for {method} {handler.path}")
+            return self._reply(handler, 404, b'{"message": "not recorded"}')
+
+        with open(path, "rb") as f:
+            payload = f.read()
+        if path.endswith(".json") and (self.rebase or self.payload_scale != 1):
+            payload = self._transform(payload)
+        self._reply(handler, 200, payload)
+
+    def _reply(self, handler: BaseHTTPRequestHandler, status: int, payload: bytes):
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _record(self, url: urllib.parse.SplitResult, method: str, body: bytes, params: dict) -> str:
+        """forward an API call to the real API and save the response, see `fixture()`"""
+        host, _, path = url.path.strip("/").partition("/")
+        request = urllib.request.Request(f"https://{host}/{path}" + (f"?{url.query}" if url.query else ""),
+                                         data=body, method=method, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            payload = response.read()
+
+        dest = os.path.join(self.fixtures, host, *path.split("/"))
+        if params:
+            dest += f"@{urllib.parse.urlencode(sorted(params.items()))}"
+        dest += ".json"
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as f:
+            f.write(payload)
+        Logger.info(f"Recorded {dest}")
+        return dest
+
+    def _transform(self, payload: bytes) -> bytes:
+        data = json.loads(payload)
+        if self.payload_scale != 1 and isinstance(data, dict):
+            for key, value in data.items():
+                if isinstance(value, list):
+                    data[key] = value * self.payload_scale
+        text = json.dumps(data, ensure_ascii=False)
+
+        if self.rebase and isinstance(data, dict):
+            recorded = next((data[k] for k in _SERVER_TIME if isinstance(data.get(k), str)), None)
+            offset = self._parse_time(recorded) if recorded is not None else None
+            if offset is not None:
+                offset = datetime.now() - offset
+                for pattern, fmt in _TIME_FORMATS:
+                    text = pattern.sub(lambda m: (datetime.strptime(m.group(0), fmt) + offset).strftime(fmt), text)
+        return text.encode("utf-8")
+
+    @staticmethod
+    def _parse_time(text: str) -> datetime:
+        for pattern, fmt in _TIME_FORMATS:
+            if pattern.fullmatch(text):
+                return datetime.strptime(text, fmt)
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the ETA APIs")
+    parser.add_argument('--host', default="127.0.0.1", type=str, dest="host")
+    parser.add_argument('-p', '--port', default=8000, type=int, dest="port")
+    parser.add_argument('-f', '--fixtures', default=FIXTURES, type=str, dest="fixtures",
+                        help="Directory of the recorded responses (Default: data/fixtures/api/)")
+    parser.add_argument('--latency', default=0, type=float, dest="latency",
+                        help="Delay every response by <latency> second")
+    parser.add_argument('--jitter', default=0, type=float, dest="jitter",
+                        help="Delay every response by a random extra of up to <jitter> second")
+    parser.add_argument('--error-rate', default=0, type=float, dest="error_rate",
+                        help="Fraction (0-1) of requests to fail with --error-status")
+    parser.add_argument('--error-status', default=500, type=int, dest="error_status",
+                        help="HTTP status of the failed requests (Default: 500)")
+    parser.add_argument('--payload-scale', default=1, type=int, dest="payload_scale",
+                        help="Repeat every top-level list of the responses <payload-scale> times")
+    parser.add_argument('--rebase', action="store_true", dest="rebase",
+                        help="Shift the timestamps of the responses as if they were recorded just now")
+    parser.add_argument('--record', action="store_true", dest="record",
+                        help="Forward the requests without recorded response to the real API and record them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    server = ApiServer(args.fixtures, args.latency, args.jitter, args.error_rate, args.error_status,
+                       args.payload_scale, args.rebase, args.record)
+    try:
+        server.serve_forever(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
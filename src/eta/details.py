@@ -3,9 +3,11 @@ import datetime
 import os
 import sys
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 sys.path.append(os.path.join(os.path.dirname((os.path.dirname(os.path.dirname(__file__)))))) # root path
 import _request as rqst
+import _routestore as store
 
 ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 PATH_DATA = os.path.join("data", "route_data")
@@ -55,8 +57,7 @@ class Details(ABC):
 class _Details(Details):
     """NOT intended to be instantiated"""
 
-    today = datetime.date.today().strftime('%Y%m%d')
-        
+
     @staticmethod
     def get_obj(co: str):
         if co == DetailsKmb.abbr:        return DetailsKmb
@@ -64,6 +65,16 @@ class _Details(Details):
         elif co == DetailsMtrBus.abbr:   return DetailsMtrBus
         elif co == DetailsMtrTrain.abbr: return DetailsMtrTrain
     
+    @staticmethod
+    def get_today() -> str:
+        """get the date of the route data (`%Y%m%d`), the route files older than 30 days from it are updated"""
+        return store.today()
+    
+    @staticmethod
+    def set_today(today: str):
+        """set the date of the route data (`%Y%m%d`), e.g. at midnight in daemon mode"""
+        store.set_today(today)
+    
     @staticmethod
     def update_all():
         for scls in _Details.__subclasses__():
@@ -73,12 +84,11 @@ class _Details(Details):
     
     @staticmethod
     def is_outdated(fpath: str, threshold = 30) -> bool:
-        today = _Details.today
+        today = store.today()
         try:
-            with open(fpath, "r", encoding = "utf-8") as f:
-                lastupd = json.load(f)["lastupdate"]
-                day_diff = (datetime.datetime.strptime(today, "%Y%m%d") - datetime.datetime.strptime(lastupd, "%Y%m%d")).days
-                return True if day_diff > threshold else False
+            lastupd = store.load(fpath)["lastupdate"]
+            day_diff = (datetime.datetime.strptime(today, "%Y%m%d") - datetime.datetime.strptime(lastupd, "%Y%m%d")).days
+            return True if day_diff > threshold else False
         except FileNotFoundError:
             return True
     
@@ -95,12 +105,35 @@ class _Details(Details):
     
     def get_route_name(self) -> str:
         return self.route
+    
+    @staticmethod
+    def _index_stops(data: dict) -> dict:
+        """`{(route, direction, stop): stop details}`"""
+        return {(route, direct, stop): entry 
+                for route, directs in data.items() 
+                for direct, stops in directs.items() if direct != 'details' 
+                for stop, entry in stops.items()}
+    
+    @staticmethod
+    def _index_ends(data: dict) -> dict:
+        """`{(route, direction): {'orig', 'dest'}}`"""
+        return {(route, direct): ends 
+                for route, directs in data.items() 
+                for direct, ends in directs['details'].items()}
+    
+    def _stops(self) -> dict:
+        return store.index(self.rte_path, "stops", self._index_stops)
+    
+    def _ends(self) -> dict:
+        return store.index(self.rte_path, "ends", self._index_ends)
 
 class DetailsKmb(_Details):
     
     abbr = "kmb"
     basedir = os.path.join(PATH_DATA, "kmb")
     rtepath = os.path.join(basedir, "route.json")
+    stoppath = os.path.join(basedir, "stop.json")
+    workers = 8 # max. concurrent requests for stops missing from the stop list
     
     def __init__(self, route: str, direction: str, service_type: int | None, stop: int | str, lang: str, root: Literal = None) -> None:
         super().__init__(route, direction, service_type, int(stop), lang, root)
@@ -113,7 +146,7 @@ class DetailsKmb(_Details):
     def update():
         dir_trans = {'O': "outbound", 'I': "inbound"}
         data = rqst.kmb_route_detail()['data']
-        output = {'lastupdate': _Details.today, 'data': {}}
+        output = {'lastupdate': store.today(), 'data': {}}
         od = output['data']
 
         for entry in data:
@@ -130,15 +163,52 @@ class DetailsKmb(_Details):
             
         with open(os.path.join(ROOT, DetailsKmb.rtepath), "w", encoding="utf-8") as f:
             f.write(json.dumps(output))
+        store.invalidate(os.path.join(ROOT, DetailsKmb.rtepath))
+    
+    @staticmethod
+    def update_stops():
+        """
+        update the list of all KMB stops (keyed by stop ID) with a single download
+        """
+        data = rqst.kmb_stop_list()['data']
+        output = {'lastupdate': store.today(), 'data': {}}
+        od = output['data']
+        
+        for entry in data:
+            od[entry['stop']] = {
+                'name_en': entry['name_en'],
+                'name_tc': entry['name_tc'],
+                'name_sc': entry['name_sc'],
+            }
+        
+        with open(os.path.join(ROOT, DetailsKmb.stoppath), "w", encoding="utf-8") as f:
+            f.write(json.dumps(output))
+        store.invalidate(os.path.join(ROOT, DetailsKmb.stoppath))
+    
+    @staticmethod
+    def get_stops() -> dict:
+        """get the list of all KMB stops, `{stop ID: {'name_en', 'name_tc', 'name_sc'}}`"""
+        fpath = os.path.join(ROOT, DetailsKmb.stoppath)
+        if _Details.is_outdated(fpath):
+            DetailsKmb.update_stops()
+        return store.load(fpath)['data']
     
     def cache(self):
         data = rqst.kmb_route_stop_detail(self.route, self.direction, self.service_type)['data']
         output = {}
-        output["lastupdate"] = self.today
+        output["lastupdate"] = store.today()
         output['data'] = [None] * len(data)
+        
+        stops = dict(self.get_stops())
+        # stops opened after the stop list was downloaded
+        missing = list({stop['stop'] for stop in data if stop['stop'] not in stops})
+        if len(missing) > 0:
+            with ThreadPoolExecutor(max_workers=min(len(missing), self.workers)) as pool:
+                for stop_id, stop_details in zip(missing, pool.map(lambda id: rqst.kmb_stop_detail(id)['data'], missing)):
+                    stops[stop_id] = stop_details
 
         for stop in data:
-            stop_details = rqst.kmb_stop_detail(stop['stop'])['data']
+            stop_details = stops[stop['stop']]
             output['data'][int(stop['seq']) - 1] = {
                 'name_en': stop_details['name_en'],
                 'name_tc': stop_details['name_tc'],
@@ -146,8 +216,10 @@ class DetailsKmb(_Details):
                 'seq': stop['seq']
             }
             
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
         with open(self.cache_path, "w", encoding="utf-8") as f:
             f.write(json.dumps(output))
+        store.invalidate(self.cache_path)
 
     def get_stop_name(self):
         #NOTE: stop ID -1 due to cache file zero-indexing
@@ -155,21 +227,26 @@ class DetailsKmb(_Details):
             key = "name_" + self.lang
             if super().is_outdated(self.cache_path):
                 self.cache()
-            with open(self.cache_path, "r", encoding="utf-8") as f:
-                data = json.load(f)["data"]
-                return data[self.stop - 1][key]
+            data = store.load(self.cache_path)["data"]
+            return data[self.stop - 1][key]
         except Exception as e:
             return "err"
     
     def _get_ends(self, key: str):
         try:
-            with open(self.rte_path, "r", encoding="utf-8") as f:
-                data = json.load(f)['data']
-                return data[self.route][self.direction][self.service_type][key]
+            return self._ends()[(self.route, self.direction, self.service_type)][key]
         except Exception as e:
             print(e)
             return "err"
     
+    @staticmethod
+    def _index_ends(data: dict) -> dict:
+        """`{(route, direction, service type): {'orig_*', 'dest_*'}}`"""
+        return {(route, direct, st): ends 
+                for route, directs in data.items() 
+                for direct, sts in directs.items() 
+                for st, ends in sts.items()}
+    
     def get_dest(self):
         return self._get_ends("dest_" + self.lang)
     
@@ -190,7 +267,7 @@ class DetailsMtrLrt(_Details):
     def update():
         data = rqst.mtr_lrt_route_stop_detail()
         dir_trans = {'1': "outbound", '2': "inbound"}
-        output = {'lastupdate': _Details.today, 'data': {}}
+        output = {'lastupdate': store.today(), 'data': {}}
         od = output['data']
         
         # [0]route, [1]direction , [2]stopCode, [3]stopID, [4]stopTCName, [5]stopENName, [6]seq
@@ -247,20 +324,17 @@ class DetailsMtrLrt(_Details):
         
         with open(os.path.join(ROOT, DetailsMtrLrt.rtepath), 'w', encoding="utf-8") as f:
             f.write(json.dumps(output))
+        store.invalidate(os.path.join(ROOT, DetailsMtrLrt.rtepath))
     
     def get_stop_name(self) -> str:
         try:                  
-            with open(self.rte_path, 'r', encoding="utf-8") as f:
-                data = json.load(f)['data']
-                return data[self.route][self.direction][self.stop]["name_" + self.lang]
+            return self._stops()[(self.route, self.direction, self.stop)]["name_" + self.lang]
         except Exception as e:
             return "err"
     
     def _get_ends(self, key):
         try:                
-            with open(self.rte_path, "r", encoding="utf-8") as f:
-                data = json.load(f)['data']
-                return data[self.route]['details'][self.direction][key]["name_" + self.lang]
+            return self._ends()[(self.route, self.direction)][key]["name_" + self.lang]
         except Exception as e:
             return "err"
         
@@ -288,7 +362,7 @@ class DetailsMtrBus(_Details):
     def update():
         stop_data = rqst.mtr_bus_stop_detail()
         dir_trans = {"I":"inbound","O":"outbound"}
-        output = {'lastupdate': _Details.today, 'data': {}}
+        output = {'lastupdate': store.today(), 'data': {}}
         od = output['data']
 
         # [0]route, [1]direction, [2]seq, [3]stopID, [4]stopLAT, [5]stopLONG, [6]stopTCName, [7]stopENName
@@ -326,12 +400,11 @@ class DetailsMtrBus(_Details):
 
         with open(os.path.join(ROOT, DetailsMtrBus.rtepath), "w", encoding="utf-8") as f:
             f.write(json.dumps(output))
+        store.invalidate(os.path.join(ROOT, DetailsMtrBus.rtepath))
     
     def get_stop_name(self) -> str:
         try:                
-            with open(self.rte_path, 'r', encoding="utf-8") as f:
-                data = json.load(f)['data']
-                return data[self.route][self.direction][self.stop]["name_" + self.lang]
+            return self._stops()[(self.route, self.direction, self.stop)]["name_" + self.lang]
         except Exception as e:
             return "err"
     
@@ -339,10 +412,7 @@ class DetailsMtrBus(_Details):
         try:
             if self.is_outdated(self.rte_path):
                 self.update()
-                
-            with open(self.rte_path, "r", encoding="utf-8") as f:
-                data = json.load(f)['data']
-                return data[self.route]['details'][self.direction][key]['name_' + self.lang]
+            return self._ends()[(self.route, self.direction)][key]['name_' + self.lang]
         except Exception as e:
             return "err"
 
@@ -364,14 +434,13 @@ class DetailsMtrBus(_Details):
             if self.is_outdated(self.rte_path):
                 self.update()
                 
-            with open(self.rte_path, "r", encoding="utf-8") as f:
-                data = json.load(f)['data']
-                if data[self.route]["details"][self.direction]["orig"]["stop_id"] == self.stop:
-                    return "orig"
-                elif data[self.route]["details"][self.direction]['dest']["stop_id"] == self.stop:
-                    return 'dest'
-                else:
-                    return "mid"
+            ends = self._ends()[(self.route, self.direction)]
+            if ends["orig"]["stop_id"] == self.stop:
+                return "orig"
+            elif ends['dest']["stop_id"] == self.stop:
+                return 'dest'
+            else:
+                return "mid"
         except Exception as e:
             return "err"
         
@@ -404,7 +473,7 @@ class DetailsMtrTrain(_Details):
             'TKS-DT': "inbound-TKS",
             'TKS-UT': "outbount-TKS"
             }
-        output = {'lastupdate': _Details.today, 'data': {}}
+        output = {'lastupdate': store.today(), 'data': {}}
         od = output['data']
         
         # line, direction, stopCode, stopID, TCName, ENName, stopSeq
@@ -441,23 +510,20 @@ class DetailsMtrTrain(_Details):
                     
         with open(os.path.join(ROOT, DetailsMtrTrain.rtepath), "w", encoding="utf-8") as f:
             f.write(json.dumps(output))
+        store.invalidate(os.path.join(ROOT, DetailsMtrTrain.rtepath))
     
     def get_route_name(self) -> str:
         return self.route_names[self.route][self.lang]
     
     def get_stop_name(self) -> str:
         try:                
-            with open(self.rte_path, 'r', encoding="utf-8") as f:
-                data = json.load(f)['data']
-                return data[self.route][self.direction][self.stop]["name_" + self.lang]
+            return self._stops()[(self.route, self.direction, self.stop)]["name_" + self.lang]
         except Exception as e:
             return "err"
     
     def _get_ends(self, key):
         try:                
-            with open(self.rte_path, "r", encoding="utf-8") as f:
-                data = json.load(f)['data']
-                return data[self.route]['details'][self.direction][key]['name_' + self.lang]
+            return self._ends()[(self.route, self.direction)][key]['name_' + self.lang]
         except Exception as e:
             return "err"
 
@@ -1,22 +1,39 @@
 import os
+import threading
 import requests
 import _request as rqst
 import details as dets
 import logging
 from eta_exceptions import *
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
 from typing import Literal
 
 Logger = logging.getLogger(__name__)
 
+@dataclass(frozen=True, slots=True)
+class EtaEntry:
+    """an ETA of a row, the same for every company"""
+    
+    eta_mins: int | str             # minutes to the arrival, or a note (e.g. "即將抵達") if there is no time
+    eta_time: str                   # HH:MM of the arrival in server time
+    arrival: datetime | None        # arrival in local time, None for notes
+    remark: str = ""
+    co: str = ""
+    dest: str = ""
+
 class Eta:
 
+    __slots__ = ("error_type", "transient", "fetched_at", "offset", "eta_len", "error", "msg", "data")
+
     dest: str
     stop: str | int
     eta_len: int
     error: bool
     msg: str
     data: list
+    fetched_at: datetime    # local time of the API response
+    offset: timedelta       # local clock - clock of the API server
     
     @staticmethod
     def get_obj(co: str):
@@ -31,25 +48,20 @@ class Eta:
         elif co == dets.DetailsMtrTrain.abbr:   return MtrTrain
     
     def __init__(self) -> None:
+        self.error_type = None
+        self.transient = False
+        self.fetched_at = datetime.now()
+        self.offset = timedelta(0)
         try:
             self.eta_len = 0
             self.error = True
             self.data = self._fetch_etas()['data']
-        except APIError:
-            self.msg = "API 錯誤"
-        except EndOfService as e:
-            self.msg = str(e)
-        except EmptyDataError:
-            self.msg = "沒有數據"
-        except StationClosed:
-            self.msg = "車站關閉"
-        except AbnormalService:
-            self.msg = "正在實施\n特別車務安排"
-        except requests.exceptions.RequestException as e:
-            self.msg = "網絡錯誤"
         except Exception as e:
-            Logger.debug(f"[Unhandled Exception] {e}")
-            self.msg = "錯誤"
+            # class name of the exception, e.g. for counting the errors by type
+            self.error_type = type(e).__name__
+            # anything but an answer of the operator (e.g. end of service) may succeed on the next try
+            self.transient = not isinstance(e, (EndOfService, EmptyDataError, StationClosed, AbnormalService))
+            self.msg = self._error_msg(e)
         else:
             self.msg = ""
             self.error = False
@@ -57,6 +69,25 @@ class Eta:
         finally:
             pass   
 
+    @staticmethod
+    def _error_msg(e: Exception) -> str:
+        """get the message to display for the exception raised while fetching the ETAs"""
+        if isinstance(e, APIError):
+            return "API 錯誤"
+        elif isinstance(e, EndOfService):
+            return str(e)
+        elif isinstance(e, EmptyDataError):
+            return "沒有數據"
+        elif isinstance(e, StationClosed):
+            return "車站關閉"
+        elif isinstance(e, AbnormalService):
+            return "正在實施\n特別車務安排"
+        elif isinstance(e, requests.exceptions.RequestException):
+            return "網絡錯誤"
+        else:
+            Logger.debug(f"[Unhandled Exception] {e}")
+            return "錯誤"
+
     def get_eta_count(self) -> int:
         return self.eta_len
 
@@ -64,23 +95,57 @@ class Eta:
         """fetch ETA data from API
 
         Returns:
-            dict: `{'co', 'eta_mins', 'eta_time', 'remark'}`
+            dict: `{'data': list[EtaEntry]}`
         """
         pass
     
-    def get_etas(self) -> list:
-        """get all ETA data returned from API
+    def _sync(self, server_time: datetime):
+        """record the time of the API response and the offset of the local clock to the one of the server
+
+        Args:
+            server_time (datetime): time of the response, as reported by the API
+        """
+        self.fetched_at = datetime.now()
+        self.offset = self.fetched_at - server_time
+    
+    def get_etas(self, now: datetime = None) -> list:
+        """get all ETA data returned from API, with `eta_mins` counted down to `now`.  
+        Entries departed by then are left out, as well as notes (e.g. "arriving") older than a minute
+
+        Args:
+            now (datetime): time to count the minutes to, default current time
 
         Returns:
-            list: list of dictionary `{'co', 'eta_mins', 'eta_time', 'remark'}`
+            list: list of `EtaEntry`
         """
         try:
-            return self.data
+            data = self.data
         except AttributeError:
             return []
+        
+        # whole minutes passed since the fetch, so the minutes shown right after it are the fetched ones
+        elapsed = int(((now or datetime.now()) - self.fetched_at).total_seconds() / 60)
+        output = []
+        for entry in data:
+            if entry.arrival is None:
+                if elapsed == 0:
+                    output.append(entry)
+            else:
+                mins = int((entry.arrival - self.fetched_at).total_seconds() / 60) - elapsed
+                if mins == entry.eta_mins:
+                    output.append(entry)
+                elif mins >= 0:
+                    output.append(replace(entry, eta_mins=mins))
+        return output
     
 class Kmb(Eta):
     
+    __slots__ = ("route", "direction", "stop", "st", "lang")
+    
+    # (route, service type) -> (response, index) of the latest response, shared by the rows on the route
+    _indexes: dict = {}
+    _indexes_lock = threading.Lock()
+    
     def __init__(self, route: str, direction: Literal["inbound", "outbound"], stop: int, service_type: int, lang: Literal["tc", "sc", "en"]):
         self.route = route
         self.direction = direction
@@ -89,39 +154,54 @@ class Kmb(Eta):
         self.lang = lang
         super().__init__()
 
+    @classmethod
+    def _index(cls, key: tuple, data: list) -> dict:
+        """get the ETAs of a route-wide response by `(dir, seq)`, built once per response
+
+        Args:
+            key (tuple): `(route, service type)` of the response
+            data (list): `data` of the response
+        """
+        with cls._indexes_lock:
+            cached = cls._indexes.get(key)
+            if cached is not None and cached[0] is data:
+                return cached[1]
+            index = {}
+            for stops in data:
+                index.setdefault((stops["dir"], stops["seq"]), []).append(stops)
+            cls._indexes[key] = (data, index)
+            return index
+
     def _fetch_etas(self) -> dict:
-        data = rqst.kmb_eta(self.route.upper(), self.st)['data']
+        response = rqst.kmb_eta(self.route.upper(), self.st)
+        data = response['data']
         
         if len(data) == 0: 
             raise APIError
+        self._sync(datetime.strptime(response["generated_timestamp"], "%Y-%m-%dT%H:%M:%S%z").replace(tzinfo=None))
 
-        eta_seq = 1
         output = {}
         output['data'] = []
-        #TODO: Optimization: by dir
+        rmk = "rmk_" + self.lang
+        index = self._index((self.route.upper(), self.st), data)
         #NOTE: the number of ETA entry form API at the same stop may not be 3 every time.  (e.g. N routes provide only 2)
-        for stops in data:
-            if stops["seq"] == self.stop and stops["dir"] == self.direction[0].upper():
-                if stops["eta"] == None:
-                    if stops["rmk_" + self.lang] == "":
-                        raise EndOfService("服務時間已過")
-                    else:
-                        raise EndOfService(stops["rmk_" + self.lang])
+        for stops in index.get((self.direction[0].upper(), self.stop), [])[:3]:
+            if stops["eta"] == None:
+                if stops[rmk] == "":
+                    raise EndOfService("服務時間已過")
+                else:
+                    raise EndOfService(stops[rmk])
 
-                eta_time = datetime.strptime(stops["eta"], "%Y-%m-%dT%H:%M:%S%z").replace(tzinfo=None)
-                now = datetime.now()
-                
-                output['data'].append(
-                    {
-                    "co": stops["co"],
-                    'eta_mins': int((eta_time - now).total_seconds() / 60),
-                    'eta_time': datetime.strftime(eta_time, "%H:%M"),
-                    'remark': stops["rmk_" + self.lang]
-                    }
-                )
-                if eta_seq == 3: break
-                eta_seq += 1   
-            else:  continue
+            eta_time = datetime.strptime(stops["eta"], "%Y-%m-%dT%H:%M:%S%z").replace(tzinfo=None)
+            arrival = eta_time + self.offset
+            
+            output['data'].append(EtaEntry(
+                eta_mins=int((arrival - self.fetched_at).total_seconds() / 60),
+                eta_time=datetime.strftime(eta_time, "%H:%M"),
+                arrival=arrival,
+                remark=stops[rmk],
+                co=stops["co"],
+            ))
 
         if len(output['data']) == 0 : 
             raise EmptyDataError
@@ -130,6 +210,8 @@ class Kmb(Eta):
 
 class MtrLrt(Eta):
 
+    __slots__ = ("route", "direction", "stop", "lang", "_dets")
+
     def __init__(self, route: str, direction: None, stop: int, service_type: None, lang: Literal["ch", "en"]):
         '''
         ``lang``: ch, en
@@ -149,6 +231,7 @@ class MtrLrt(Eta):
             raise APIError
 
         timestamp = datetime.strptime(data["system_time"], "%Y-%m-%d %H:%M:%S")
+        self._sync(timestamp)
         output = {}
         output['data'] = []
 
@@ -163,17 +246,17 @@ class MtrLrt(Eta):
                         eta_min = int(eta_min)
                     except ValueError:
                         #NOTE: 'eta_mins' may not a be a number due to "即將抵達/離開" -> ValueError
-                        output['data'].append({
-                                'eta_mins': eta_min,
-                                'eta_time': "----",
-                                'remark': "",
-                        })
+                        output['data'].append(EtaEntry(
+                                eta_mins=eta_min,
+                                eta_time="----",
+                                arrival=None,
+                        ))
                     else:
-                        output['data'].append({
-                                'eta_mins': eta_min,
-                                'eta_time': datetime.strftime(timestamp + timedelta(minutes=int(eta_min)), "%H:%M"),
-                                'remark': "",
-                        })
+                        output['data'].append(EtaEntry(
+                                eta_mins=eta_min,
+                                eta_time=datetime.strftime(timestamp + timedelta(minutes=int(eta_min)), "%H:%M"),
+                                arrival=self.fetched_at + timedelta(minutes=eta_min),
+                        ))
                         
         if len(output['data']) == 0 : 
             raise EmptyDataError
@@ -182,6 +265,8 @@ class MtrLrt(Eta):
 
 class MtrBus(Eta):
     
+    __slots__ = ("route", "direction", "stop", "lang", "_dets")
+    
     def __init__(self, route: str, direction: str, stop: str, service_type: None, lang: Literal["zh", "en"]):
         '''
         ``dir``: outbound, inbound
@@ -209,34 +294,40 @@ class MtrBus(Eta):
             raise EndOfService("服務時間已過")
         
         timestamp = datetime.strptime(data["routeStatusTime"], "%Y/%m/%d %H:%M")
+        self._sync(timestamp)
         output = {}
         output['data'] = []
         
         for stops in data["busStop"]:
             if stops["busStopId"] == self.stop:
                 for bus in stops["bus"]:
-                    entry = {}
                     # eta_mins
                     if self._dets.get_stop_type() == 'orig':
                         time_ref = "departure"
                     elif self._dets.get_stop_type() in ("mid","dest"):
                         time_ref = "arrival"
-                    entry['eta_mins'] = bus[time_ref+"TimeText"].split(" ")[0]
+                    eta_mins = bus[time_ref+"TimeText"].split(" ")[0]
+                    # the minutes are counted from the response, "arriving" notes have no arrival time
+                    if eta_mins.isdigit():
+                        eta_mins = int(eta_mins)
+                        arrival = self.fetched_at + timedelta(minutes=eta_mins)
+                    else:
+                        arrival = None
 
                     # eta_time
                     try:
-                        entry['eta_time'] = datetime.strftime(timestamp + timedelta(seconds = int(bus[time_ref + "TimeInSecond"])), "%H:%M")
+                        eta_time = datetime.strftime(timestamp + timedelta(seconds = int(bus[time_ref + "TimeInSecond"])), "%H:%M")
                     except ValueError:
-                        entry['eta_time'] = "--"
+                        eta_time = "--"
 
                     # remark
                     if bus["isScheduled"]:
-                        if self.lang == "zh": entry['remark'] = "原定班次"
-                        else: entry['remark'] = "Scheduled Bus"
+                        if self.lang == "zh": remark = "原定班次"
+                        else: remark = "Scheduled Bus"
                     else:
-                        entry['remark'] = ""
+                        remark = ""
 
-                    output['data'].append(entry)
+                    output['data'].append(EtaEntry(eta_mins, eta_time, arrival, remark))
                 break
 
         if len(output['data']) == 0 : 
@@ -246,6 +337,8 @@ class MtrBus(Eta):
 
 class MtrTrain(Eta):
     
+    __slots__ = ("route", "direction", "stop", "st", "lang")
+    
     dir_trans = {"inbound": "UP", "outbound": "DOWN"}
     dir_rtrans = {'UP': "inbound", 'DOWN': "outbound"}
     
@@ -269,6 +362,7 @@ class MtrTrain(Eta):
                 raise AbnormalService
         else:
             timestamp = datetime.strptime(data["sys_time"], "%Y-%m-%d %H:%M:%S")
+            self._sync(timestamp)
             e_data = data['data'][f'{self.route}-{self.stop}']
             output = {}
             output['data'] = []
@@ -276,14 +370,13 @@ class MtrTrain(Eta):
             for entry in e_data[self.direction]:
                 eta_time = datetime.strptime(entry["time"], "%Y-%m-%d %H:%M:%S")
                 
-                output['data'].append(
-                    {
-                    'eta_mins': int((eta_time - timestamp).total_seconds() / 60),
-                    'eta_time': datetime.strftime(eta_time, "%H:%M"),
-                    'dest': entry['dest'],
-                    'remark': data['message']
-                    }
-                )
+                output['data'].append(EtaEntry(
+                    eta_mins=int((eta_time - timestamp).total_seconds() / 60),
+                    eta_time=datetime.strftime(eta_time, "%H:%M"),
+                    arrival=eta_time + self.offset,
+                    remark=data['message'],
+                    dest=entry['dest'],
+                ))
 
             if len(output['data']) == 0 : 
                 raise EmptyDataError
@@ -0,0 +1,122 @@
+"""
+Last successful ETAs of each row of eta.json, served while a refresh is in flight or failing.
+
+The arrival times are kept along the ETAs, so the minutes shown keep counting down
+instead of repeating the ones fetched
+"""
+import json
+import os
+import threading
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from eta.eta import Eta, EtaEntry
+
+class CachedEta(Eta):
+    """stand-in of an `eta.Eta` built from the cache, counting its minutes down from the time of the fetch
+
+    Args:
+        etas (list): cached `eta.EtaEntry` of the row
+        fetched_at (datetime): time of the fetch
+        stale_after (int): age in second after which the ETAs are stale
+    """
+
+    __slots__ = ("stale_after",)
+
+    def __init__(self, etas: list, fetched_at: datetime, stale_after: int) -> None:
+        self.error_type = None
+        self.transient = False
+        self.fetched_at = fetched_at
+        self.offset = timedelta(0)
+        self.stale_after = stale_after
+        self.data = etas
+        self.eta_len = len(self.get_etas())
+        self.error = self.eta_len == 0
+        self.msg = "沒有數據" if self.error else ""
+
+    @property
+    def stale(self) -> bool:
+        """older than `stale_after`, checked on every draw as the row may be shown again until its next fetch"""
+        return (datetime.now() - self.fetched_at).total_seconds() > self.stale_after
+
+
+class EtaCache:
+    """last successful ETAs of each row, kept in memory and in the JSON file `path`
+
+    Args:
+        path (str): file to persist the cache to, None for memory only
+        stale_after (int): age in second after which the cached ETAs are marked stale
+        expire_after (int): age in second after which the cached ETAs are no longer served
+    """
+
+    def __init__(self, path: str = None, stale_after: int = 180, expire_after: int = 1800) -> None:
+        self.path = path
+        self.stale_after = stale_after
+        self.expire_after = expire_after
+        self._rows = None   # {key: {'fetched_at', 'etas'}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(entry: dict) -> str:
+        """get the cache key of a row of eta.json"""
+        return json.dumps(entry, sort_keys=True, ensure_ascii=False)
+
+    def put(self, key: str, eta: Eta):
+        """store the ETAs of a successful fetch"""
+        etas = []
+        for entry in eta.data:
+            entry = asdict(entry)
+            if entry['arrival'] is not None:
+                entry['arrival'] = entry['arrival'].isoformat()
+            etas.append(entry)
+        with self._lock:
+            self._load()
+            self._rows[key] = {'fetched_at': eta.fetched_at.isoformat(), 'etas': etas}
+
+    def get(self, key: str) -> CachedEta | None:
+        """get the cached ETAs of a row, None if there is none or it has expired"""
+        with self._lock:
+            self._load()
+            row = self._rows.get(key)
+        if row is None or self._expired(row):
+            return None
+        try:
+            etas = [EtaEntry(**{**entry, 'arrival': datetime.fromisoformat(entry['arrival']) if entry['arrival'] else None})
+                    for entry in row['etas']]
+        except (KeyError, TypeError):
+            # written by an older version
+            return None
+        return CachedEta(etas, datetime.fromisoformat(row['fetched_at']), self.stale_after)
+
+    def has(self, key: str) -> bool:
+        """check if there are ETAs of a row to serve, without building them"""
+        with self._lock:
+            self._load()
+            row = self._rows.get(key)
+        return row is not None and not self._expired(row)
+
+    def _expired(self, row: dict) -> bool:
+        return (datetime.now() - datetime.fromisoformat(row['fetched_at'])).total_seconds() > self.expire_after
+
+    def save(self):
+        """write the cache to `path`"""
+        if self.path is None:
+            return
+        with self._lock:
+            self._load()
+            text = json.dumps(self._rows, ensure_ascii=False)
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(text)
+        except OSError:
+            pass
+
+    def _load(self):
+        if self._rows is not None:
+            return
+        self._rows = {}
+        if self.path is not None and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._rows = json.load(f)
+            except (OSError, ValueError):
+                pass
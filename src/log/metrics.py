@@ -0,0 +1,121 @@
+"""
+Counters, gauges and histograms of the refresh loop, exposed in the Prometheus text format
+(https://prometheus.io/docs/instrumenting/exposition_formats/) by an optional HTTP endpoint
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds in second of the histogram buckets, from a cached lookup to a 4 gray refresh
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: dict, le: str = None) -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._meta = {}     # name -> (type, help)
+        self._values = {}   # (name, labels) -> value, or [bucket counts, sum, count] of histograms
+        self._httpd: ThreadingHTTPServer = None
+
+    def describe(self, name: str, type: str, help: str):
+        """declare the type (counter, gauge, histogram) and help text of a metric"""
+        with self._lock:
+            self._meta[name] = (type, help)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """add `value` to the counter `name`"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._meta.setdefault(name, ("counter", ""))
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """set the gauge `name` to `value`"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._meta.setdefault(name, ("gauge", ""))
+            self._values[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """add `value` to the histogram `name`"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._meta.setdefault(name, ("histogram", ""))
+            hist = self._values.setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def exposition(self) -> str:
+        """get every metric in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for name, (type, help) in sorted(self._meta.items()):
+                series = sorted((labels, value) for (n, labels), value in self._values.items() if n == name)
+                if len(series) == 0:
+                    continue
+                if help:
+                    lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, value in series:
+                    labels = dict(labels)
+                    if type == "histogram":
+                        buckets, total, count = value
+                        for bound, n in zip(BUCKETS, buckets):
+                            lines.append(f"{name}_bucket{_labels(labels, _number(bound))} {n}")
+                        lines.append(f"{name}_bucket{_labels(labels, '+Inf')} {count}")
+                        lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                        lines.append(f"{name}_count{_labels(labels)} {count}")
+                    else:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str = "0.0.0.0", port: int = 9100) -> str:
+        """serve the metrics at http://`host`:`port`/metrics in a background thread
+
+        Returns:
+            str: URL of the endpoint
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                payload = metrics.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._httpd.server_address[1]}/metrics"
+
+    def close(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+metrics = Metrics()
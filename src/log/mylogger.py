@@ -1,5 +1,9 @@
+import contextlib
 import datetime
+import json
 import logging
+import threading
+import time
 from typing import Literal
 
 def singleton(cls):
@@ -25,6 +29,12 @@ class Logger:
     def __init__(self) -> None:
         self.log = logging.getLogger('mylogger')
         self.log.setLevel(logging.DEBUG)
+        # timings of the current refresh, {name: [total second, count]}
+        self.timings = {}
+        self.last_timings = None
+        self._refresh_start = None
+        self._timings_lock = threading.Lock()
+        self._listeners = []
     
     def set_log_level(self, lv):
         self.log.setLevel(lv)
@@ -46,4 +56,65 @@ class Logger:
             datefmt='%H:%M:%S')
         fh.setLevel(lv)
         fh.setFormatter(format)
-        self.log.addHandler(fh)
\ No newline at end of file
+        self.log.addHandler(fh)
+    
+    # -------------------- timing --------------------
+    
+    @contextlib.contextmanager
+    def span(self, name: str):
+        """time the enclosed block as `name` of the current refresh.  
+        Spans of the same name (e.g. one per row) are summed up and counted
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def record(self, name: str, seconds: float):
+        """add `seconds` measured elsewhere (e.g. BUSY wait of the e-paper) to `name` of the current refresh"""
+        with self._timings_lock:
+            entry = self.timings.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+        for listener in self._listeners:
+            listener(name, seconds)
+    
+    def listen(self, listener):
+        """call `listener(name, seconds)` with every timing recorded, and with `("refresh", total)` at the end of each refresh"""
+        self._listeners.append(listener)
+    
+    def begin_refresh(self):
+        """start collecting the timings of a refresh, the previous ones are discarded"""
+        with self._timings_lock:
+            self.timings = {}
+            self._refresh_start = time.perf_counter()
+    
+    def end_refresh(self, path: str = None) -> dict:
+        """log the timing summary of the refresh in one line and optionally append it to the JSON lines file `path`
+
+        Returns:
+            dict: `{'time', 'total', 'spans': {name: {'total', 'count'}}}`, times in second
+        """
+        with self._timings_lock:
+            total = time.perf_counter() - self._refresh_start if self._refresh_start is not None else 0.0
+            summary = {
+                'time': datetime.datetime.now().isoformat(timespec="seconds"),
+                'total': round(total, 4),
+                'spans': {name: {'total': round(t, 4), 'count': n} for name, (t, n) in self.timings.items()},
+            }
+            self._refresh_start = None
+            self.last_timings = summary
+        for listener in self._listeners:
+            listener("refresh", total)
+        
+        self.log.info(f"Refresh took {summary['total']:.2f}s: " + ", ".join(
+            f"{name} {span['total']:.2f}s" + (f" ({span['count']})" if span['count'] > 1 else "") 
+            for name, span in summary['spans'].items()))
+        if path is not None:
+            try:
+                with open(path, 'a', encoding="utf-8") as f:
+                    f.write(json.dumps(summary) + "\n")
+            except OSError as e:
+                self.log.warning(f"Failed to save the timings to {path}: {e}")
+        return summary
\ No newline at end of file
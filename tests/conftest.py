@@ -0,0 +1,41 @@
+"""
+Shared setup of the tests: import paths, the simulated e-Paper module and a display in a temporary root.  
+`epd3in7_display()` is also used by the benchmarks (bench/bench_display.py)
+"""
+import json
+import os
+import shutil
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the drivers talk to epdconfig.Simulated instead of the hardware
+os.environ.setdefault("EPD_SIMULATED", "1")
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "src"))
+sys.path.append(os.path.join(ROOT, "src", "eta"))
+
+def epd3in7_display(root: str, rows: list = ()):
+    """get an `Epd3in7` (3 ETAs per row) in the root directory `root`, 
+    with `rows` as its conf/eta.json and the fonts of the repository
+
+    Returns:
+        Epd3in7: the display
+    """
+    from display.waveshare import epd3in7
+    os.makedirs(os.path.join(root, "conf"), exist_ok=True)
+    os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+    with open(os.path.join(root, "conf", "eta.json"), "w", encoding="utf-8") as f:
+        json.dump(list(rows), f)
+    if not os.path.exists(os.path.join(root, "font")):
+        try:
+            os.symlink(os.path.join(ROOT, "font"), os.path.join(root, "font"))
+        except OSError:
+            shutil.copytree(os.path.join(ROOT, "font"), os.path.join(root, "font"))
+    return epd3in7.Epd3in7(str(root), 3)
+
+@pytest.fixture
+def make_display(tmp_path):
+    """`epd3in7_display()` in the temporary directory of the test, `make_display(rows)`"""
+    return lambda rows=(): epd3in7_display(str(tmp_path), rows)
@@ -0,0 +1,53 @@
+"""
+Cached background layer of the displays
+"""
+import os
+import pytest
+from display.interface import Row
+
+class Details:
+    """route details with fixed titles"""
+
+    def __init__(self, route: str, dest: str, stop: str) -> None:
+        self.route, self.dest, self.stop = route, dest, stop
+
+    def get_route_name(self): return self.route
+    def get_dest(self): return self.dest
+    def get_stop_name(self): return self.stop
+
+@pytest.fixture
+def display(make_display):
+    display = make_display()
+    display.renders = 0
+    def draw_background(drawing, rows):
+        display.renders += 1
+        for row, (_dets, _eta) in enumerate(rows):
+            drawing.text((5, 80*row), f"{_dets.get_route_name()} {_dets.get_dest()} @{_dets.get_stop_name()}", fill=0)
+    display.draw_background = draw_background
+    return display
+
+def backgrounds(display) -> list:
+    return sorted(name for name in os.listdir(os.path.join(display.root, "tmp")) if name.startswith("bg-"))
+
+def test_cached_by_titles(display):
+    rows = [Row(Details("1", "竹園邨", "尖沙咀碼頭"), None)]
+    first = display.background(rows)
+    assert display.background(rows) is first
+    assert display.renders == 1
+    assert len(backgrounds(display)) == 1
+
+    display._bg = None
+    display.background(rows)
+    assert display.renders == 1, "loaded from tmp/"
+
+    display.background([Row(Details("1", "竹園邨", "中港城"), None)])
+    assert display.renders == 2
+    assert len(backgrounds(display)) == 1, "the previous background is removed"
+
+def test_failed_titles_not_saved(display):
+    display.background([Row(Details("1", "竹園邨", "err"), None)])
+    assert backgrounds(display) == []
+
+    display.background([Row(Details("1", "竹園邨", "尖沙咀碼頭"), None)])
+    assert display.renders == 2
+    assert len(backgrounds(display)) == 1
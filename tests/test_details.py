@@ -0,0 +1,17 @@
+"""
+Route details shared state
+"""
+import importlib
+import details
+from eta import details as dets
+
+def test_set_today():
+    # imported as `details` by the ETA classes, as `eta.details` by the displays and as `src.eta.details` by main.py,
+    # the date is kept in `_routestore` for all of them
+    src_dets = importlib.import_module("src.eta.details")
+    before = dets._Details.get_today()
+    try:
+        dets._Details.set_today("20990101")
+        assert details._Details.get_today() == src_dets._Details.get_today() == "20990101"
+    finally:
+        dets._Details.set_today(before)
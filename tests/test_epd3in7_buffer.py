@@ -0,0 +1,105 @@
+"""
+epd3in7 frame buffer packing, against the per-pixel loops it replaced
+"""
+import random
+import pytest
+from PIL import Image
+from display.waveshare.epd_lib import epd3in7 as epd
+
+WIDTH, HEIGHT = epd.EPD_WIDTH, epd.EPD_HEIGHT
+
+def reference_getbuffer(image):
+    """`EPD.getbuffer()` before it was packed from `Image.tobytes()`"""
+    buf = [0xFF] * (int(WIDTH/8) * HEIGHT)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if(imwidth == WIDTH and imheight == HEIGHT):
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * WIDTH) / 8)] &= ~(0x80 >> (x % 8))
+    elif(imwidth == HEIGHT and imheight == WIDTH):
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = HEIGHT - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy*WIDTH) / 8)] &= ~(0x80 >> (y % 8))
+    return bytes(b & 0xFF for b in buf)
+
+def reference_getbuffer_4Gray(image):
+    """`EPD.getbuffer_4Gray()` before it was packed from `Image.tobytes()`"""
+    buf = [0xFF] * (int(WIDTH / 4) * HEIGHT)
+    image_monocolor = image.convert('L')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    i=0
+    if(imwidth == WIDTH and imheight == HEIGHT):
+        for y in range(imheight):
+            for x in range(imwidth):
+                if(pixels[x, y] == 0xC0):
+                    pixels[x, y] = 0x80
+                elif (pixels[x, y] == 0x80):
+                    pixels[x, y] = 0x40
+                i = i + 1
+                if(i%4 == 0):
+                    buf[int((x + (y * WIDTH))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
+    elif(imwidth == HEIGHT and imheight == WIDTH):
+        for x in range(imwidth):
+            for y in range(imheight):
+                newx = y
+                newy = imwidth - x - 1
+                if(pixels[x, y] == 0xC0):
+                    pixels[x, y] = 0x80
+                elif (pixels[x, y] == 0x80):
+                    pixels[x, y] = 0x40
+                i = i + 1
+                if(i%4 == 0):
+                    buf[int((newx + (newy * WIDTH))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
+    return bytes(buf)
+
+def frame(size: tuple, mode: str, seed: int = 0) -> Image.Image:
+    """random blocks of the 4 gray levels, so every orientation gives a different buffer"""
+    rand = random.Random(seed)
+    img = Image.new('L', size, 0xFF)
+    for _ in range(300):
+        x, y = rand.randrange(size[0]), rand.randrange(size[1])
+        img.paste(rand.choice((epd.GRAY1, epd.GRAY2, epd.GRAY3, epd.GRAY4)), (x, y, x + rand.randrange(1, 40), y + rand.randrange(1, 40)))
+    return img.convert(mode)
+
+ORIENTATIONS = {'vertical': (WIDTH, HEIGHT), 'horizontal': (HEIGHT, WIDTH)}
+
+@pytest.fixture(scope="module")
+def driver():
+    return epd.EPD()
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("mode", ['1', 'L'])
+def test_getbuffer(driver, orientation, mode):
+    img = frame(ORIENTATIONS[orientation], mode)
+    assert bytes(driver.getbuffer(img)) == reference_getbuffer(img)
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("mode", ['1', 'L'])
+def test_getbuffer_4Gray(driver, orientation, mode):
+    img = frame(ORIENTATIONS[orientation], mode)
+    assert bytes(driver.getbuffer_4Gray(img)) == reference_getbuffer_4Gray(img)
+
+def test_wrong_size_is_blank(driver):
+    img = frame((100, 100), 'L')
+    assert bytes(driver.getbuffer(img)) == reference_getbuffer(img)
+    assert bytes(driver.getbuffer_4Gray(img)) == reference_getbuffer_4Gray(img)
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("mode", ['1', 'L'])
+@pytest.mark.parametrize("deg", [0, 90, 180, 270, 45])
+def test_rotation(driver, orientation, mode, deg):
+    """`-r <deg>` is folded into the packing, the buffers are the ones of the rotated image"""
+    img = frame(ORIENTATIONS[orientation], mode, seed=deg)
+    assert bytes(driver.getbuffer(img, deg)) == reference_getbuffer(img.rotate(deg))
+    assert bytes(driver.getbuffer_4Gray(img, deg)) == reference_getbuffer_4Gray(img.rotate(deg))
+
+def test_rotations_differ(driver):
+    img = frame((WIDTH, HEIGHT), 'L')
+    assert len({bytes(driver.getbuffer_4Gray(img, deg)) for deg in (0, 90, 180, 270)}) == 4
@@ -0,0 +1,54 @@
+"""
+epd3in7 4 gray RAM plane encoding, against the per-bit loops of `display_4Gray()` it replaced
+"""
+import pytest
+from display.waveshare.epd_lib import epdconfig
+from display.waveshare.epd_lib import epd3in7 as epd
+
+# level of a pixel (highest 2 bits) -> its bit in RAM plane 0x24 / 0x26
+PLANE_BITS = {
+    0x24: {0xC0: 1, 0x00: 0, 0x80: 0, 0x40: 1},
+    0x26: {0xC0: 1, 0x00: 0, 0x80: 1, 0x40: 0},
+}
+
+def reference_encode(image: bytes, plane: int) -> bytes:
+    """the bytes `display_4Gray()` sent to `plane` before the lookup tables"""
+    bits = PLANE_BITS[plane]
+    output = bytearray()
+    for i in range(len(image) // 2):
+        temp3=0
+        for j in range(0, 2):
+            temp1 = image[i*2+j]
+            for k in range(0, 2):
+                temp3 |= bits[temp1&0xC0]
+                temp3 <<= 1
+                temp1 <<= 2
+                temp3 |= bits[temp1&0xC0]
+                if(j!=1 or k!=1):
+                    temp3 <<= 1
+                temp1 <<= 2
+        output.append(temp3)
+    return bytes(output)
+
+# every pair of bytes of the 2 bit gray buffer, i.e. every 8 pixels
+ALL_PAIRS = bytes(b for pair in range(0x10000) for b in (pair >> 8, pair & 0xFF))
+FRAME = epd.EPD_WIDTH // 4 * epd.EPD_HEIGHT
+
+@pytest.mark.parametrize("plane", [0x24, 0x26])
+def test_encode_every_byte_pair(plane):
+    assert bytes(epd.EPD._encode_4Gray(ALL_PAIRS, plane)) == reference_encode(ALL_PAIRS, plane)
+
+def test_display_4Gray_stream():
+    """the RAM planes sent to the (simulated) module for frames covering every byte pair"""
+    sim = epdconfig.implementation
+    if not isinstance(sim, epdconfig.Simulated):
+        pytest.skip("epdconfig is not using the simulated e-Paper module")
+    driver = epd.EPD()
+    for start in range(0, len(ALL_PAIRS), FRAME):
+        frame = ALL_PAIRS[start:start + FRAME]
+        frame += bytes([0xFF] * (FRAME - len(frame)))
+        sim.reset_stats()
+        driver.display_4Gray(frame)
+        for plane in (0x24, 0x26):
+            sent = b"".join(bytes(data) for command, data in sim.commands if command == plane)
+            assert sent == reference_encode(frame, plane)
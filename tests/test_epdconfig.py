@@ -0,0 +1,101 @@
+"""
+BUSY wait of epdconfig and the Raspberry Pi backend, on FakeGPIO
+"""
+import time
+import pytest
+from display.waveshare.epd_lib import epdconfig
+
+class RecordingGPIO(epdconfig.FakeGPIO):
+    """FakeGPIO recording the edges waited for"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.edges = []
+
+    def wait_for_edge(self, pin, edge, timeout=None):
+        self.edges.append(edge)
+        return super().wait_for_edge(pin, edge, timeout)
+
+class NoEdgeGPIO(RecordingGPIO):
+    """edge detection unavailable, like with the BUSY pin already in use"""
+
+    def wait_for_edge(self, pin, edge, timeout=None):
+        self.edges.append(edge)
+        raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+
+class FakeSPI:
+
+    def __init__(self):
+        self.transfers = []
+        self.opened = False
+
+    def open(self, bus, device): self.opened = True
+
+    def close(self): self.opened = False
+
+    def writebytes(self, data): self.transfers.append(bytes(data))
+
+    def writebytes2(self, data): self.transfers.append(bytes(data))
+
+def test_wait_until_released():
+    gpio = RecordingGPIO(busy_ms=50)
+    gpio.trigger_busy()
+    waited = epdconfig.wait_for_level(gpio, gpio.busy_pin, 1, 1000)
+    assert 0.04 <= waited < 0.5
+    assert gpio.input(gpio.busy_pin) == 0
+    assert set(gpio.edges) == {gpio.FALLING}, "released on the falling edge"
+    assert len(gpio.edges) == 1, "no polling"
+
+def test_not_busy():
+    gpio = RecordingGPIO()
+    assert epdconfig.wait_for_level(gpio, gpio.busy_pin, 1, 1000) < 0.01
+    assert gpio.edges == []
+
+def test_timeout():
+    gpio = RecordingGPIO(busy_ms=1000)
+    gpio.trigger_busy()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        epdconfig.wait_for_level(gpio, gpio.busy_pin, 1, 50)
+    assert time.monotonic() - start < 0.5
+
+def test_active_low():
+    # e.g. UC81xx controllers: BUSY is low while busy
+    gpio = RecordingGPIO(busy_level=0, busy_ms=50)
+    gpio.trigger_busy()
+    assert gpio.input(gpio.busy_pin) == 0
+    assert epdconfig.wait_for_level(gpio, gpio.busy_pin, 0, 1000) >= 0.04
+    assert gpio.input(gpio.busy_pin) == 1
+    assert set(gpio.edges) == {gpio.RISING}
+
+def test_polling_fallback():
+    gpio = NoEdgeGPIO(busy_ms=50)
+    gpio.trigger_busy()
+    waited = epdconfig.wait_for_level(gpio, gpio.busy_pin, 1, 1000)
+    assert 0.04 <= waited < 0.5
+    assert len(gpio.edges) > 1, "polled until released"
+
+    gpio.trigger_busy(1000)
+    with pytest.raises(TimeoutError):
+        epdconfig.wait_for_level(gpio, gpio.busy_pin, 1, 50)
+
+def test_raspberry_pi():
+    gpio, spi = RecordingGPIO(busy_ms=30), FakeSPI()
+    rpi = epdconfig.RaspberryPi(GPIO=gpio, SPI=spi)
+    rpi.bufsiz = 4096
+    assert rpi.module_init() == 0 and spi.opened
+
+    rpi.digital_write(rpi.DC_PIN, 1)
+    assert gpio.pins[rpi.DC_PIN] == 1
+    gpio.trigger_busy()
+    assert rpi.digital_read(rpi.BUSY_PIN) == 1
+    assert rpi.wait_busy(rpi.BUSY_PIN) >= 0.02
+
+    data = bytes(range(256)) * 40
+    rpi.spi_writebyte2(data)
+    assert [len(t) for t in spi.transfers] == [4096, 4096, 2048], "split at the spidev buffer size"
+    assert b"".join(spi.transfers) == data
+
+    rpi.module_exit()
+    assert not spi.opened
+    assert gpio.pins[rpi.RST_PIN] == gpio.pins[rpi.DC_PIN] == 0
@@ -0,0 +1,70 @@
+"""
+Countdown of the fetched ETAs to the time of drawing (`Eta.get_etas(now)`), for the records of each operator
+"""
+from datetime import timedelta
+import pytest
+import _request as rqst
+import details
+from eta import eta
+
+@pytest.fixture(autouse=True)
+def route_data():
+    # the route data in data/route_data/ is up to date, nothing is downloaded
+    before = details._Details.get_today()
+    details._Details.set_today("20220705")
+    yield
+    details._Details.set_today(before)
+
+def fetch(monkeypatch, call: str, payload: dict, co: str, **row) -> eta.Eta:
+    monkeypatch.setattr(rqst, call, lambda *args, **kwargs: payload)
+    _eta = eta.Eta.get_obj(co)(**row)
+    assert not _eta.error, _eta.msg
+    return _eta
+
+def mins(_eta: eta.Eta, seconds: float) -> list:
+    return [e.eta_mins for e in _eta.get_etas(_eta.fetched_at + timedelta(seconds=seconds))]
+
+def test_kmb(monkeypatch):
+    data = [{'co': "KMB", 'dir': "O", 'seq': 2, 'eta': f"2022-07-05T12:{m}+08:00", 'rmk_tc': ""} 
+            for m in ("02:30", "10:00", "21:00", "30:00")]
+    _eta = fetch(monkeypatch, "kmb_eta", {'generated_timestamp': "2022-07-05T12:00:00+08:00", 'data': data}, 
+                 "kmb", route="1", direction="outbound", stop=2, service_type="1", lang="tc")
+    assert mins(_eta, 0) == mins(_eta, 59) == [2, 10, 21], "3 ETAs at most"
+    assert _eta.get_etas(_eta.fetched_at) == _eta.data
+    assert mins(_eta, 61) == [1, 9, 20]
+    assert mins(_eta, 3 * 60) == [7, 18], "departed"
+    assert [e.eta_time for e in _eta.get_etas(_eta.fetched_at + timedelta(minutes=3))] == ["12:10", "12:21"]
+    assert mins(_eta, 30 * 60) == []
+
+def test_mtr_bus(monkeypatch):
+    buses = [{'arrivalTimeText': text, 'arrivalTimeInSecond': str(sec), 'departureTimeText': text, 
+              'departureTimeInSecond': str(sec), 'isScheduled': "0"} 
+             for text, sec in (("即將抵達", 30), ("5 分鐘", 300), ("12 分鐘", 720))]
+    payload = {'routeStatusRemarkTitle': None, 'routeStatusTime': "2022/07/05 12:00", 
+               'busStop': [{'busStopId': "K12-U020", 'bus': buses}]}
+    _eta = fetch(monkeypatch, "mtr_bus_eta", payload, 
+                 "mtr_bus", route="K12", direction="outbound", stop="K12-U020", service_type=None, lang="zh")
+    assert mins(_eta, 0) == mins(_eta, 59) == ["即將抵達", 5, 12]
+    assert mins(_eta, 60) == [4, 11], "notes last a minute"
+    assert mins(_eta, 6 * 60) == [6]
+
+def test_mtr_train(monkeypatch):
+    payload = {'status': 1, 'message': "", 'sys_time': "2022-07-05 12:00:00", 
+               'data': {'TKL-TKO': {'UP': [{'time': f"2022-07-05 12:{m}:00", 'dest': "POA"} for m in ("00", "04", "11")]}}}
+    _eta = fetch(monkeypatch, "mtr_train_eta", payload, 
+                 "mtr_train", route="TKL", direction="inbound", stop="TKO", service_type=None, lang="tc")
+    assert mins(_eta, 0) == [0, 4, 11]
+    assert mins(_eta, 90) == [3, 10], "departed"
+    assert [e.dest for e in _eta.get_etas(_eta.fetched_at + timedelta(minutes=1))] == ["POA", "POA"]
+
+def test_mtr_lrt(monkeypatch):
+    # data/route_data/mtr/lrt/route.json cannot be read, the destination is given
+    monkeypatch.setattr(details.DetailsMtrLrt, "get_dest", lambda self: "兆康")
+    routes = [{'route_no': "505", 'dest_ch': dest, 'time_ch': time} 
+              for dest, time in (("兆康", "即將抵達"), ("兆康", "4 分鐘"), ("三聖", "6 分鐘"), ("兆康", "9 分鐘"))]
+    payload = {'status': 1, 'system_time': "2022-07-05 12:00:00", 'platform_list': [{'route_list': routes}]}
+    _eta = fetch(monkeypatch, "mtr_lrt_eta", payload, 
+                 "mtr_lrt", route="505", direction="outbound", stop=920, service_type=None, lang="ch")
+    assert mins(_eta, 0) == ["即將抵達", 4, 9]
+    assert mins(_eta, 2 * 60 + 5) == [2, 7]
+    assert mins(_eta, 5 * 60) == [4]
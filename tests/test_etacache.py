@@ -0,0 +1,98 @@
+"""
+Cache of the last successful ETAs, and its use by `DisplayABC._fetch_row()`
+"""
+import json
+from datetime import datetime, timedelta
+import pytest
+import requests
+import etacache
+from eta import eta
+
+ROW = {'eta_co': "kmb", 'route': "1", 'direction': "outbound", 'service_type': "1", 'stop': 2, 'lang': "tc"}
+
+def etas(fetched_at: datetime) -> list:
+    return [eta.EtaEntry("即將抵達", "----", None),
+            eta.EtaEntry(4, "12:04", fetched_at + timedelta(minutes=4, seconds=30), remark="原定班次", co="KMB"),
+            eta.EtaEntry(11, "12:11", fetched_at + timedelta(minutes=11), dest="POA")]
+
+def fetched(age: float) -> etacache.CachedEta:
+    """ETAs fetched `age` second ago"""
+    fetched_at = datetime.now() - timedelta(seconds=age)
+    return etacache.CachedEta(etas(fetched_at), fetched_at, 180)
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "eta_cache.json")
+    cache = etacache.EtaCache(path)
+    key = cache.key(ROW)
+    source = fetched(0)
+    cache.put(key, source)
+    cache.save()
+
+    loaded = etacache.EtaCache(path).get(key)
+    assert loaded.fetched_at == source.fetched_at
+    assert loaded.data == source.data
+    assert not loaded.error
+    assert etacache.EtaCache(path).get(cache.key({**ROW, 'stop': 3})) is None
+
+def test_key_order():
+    assert etacache.EtaCache.key(ROW) == etacache.EtaCache.key(dict(reversed(ROW.items())))
+
+def test_expire_after():
+    cache = etacache.EtaCache(expire_after=600)
+    cache.put("old", fetched(601))
+    cache.put("new", fetched(599))
+    assert cache.get("old") is None and not cache.has("old")
+    assert cache.get("new") is not None and cache.has("new")
+    assert not cache.has("none")
+
+def test_stale():
+    cache = etacache.EtaCache(stale_after=60)
+    cache.put("row", fetched(30))
+    row = cache.get("row")
+    assert row.stale_after == 60 and not row.stale
+    row.fetched_at -= timedelta(seconds=31)
+    assert row.stale, "checked on every draw"
+
+def test_counts_down():
+    cache = etacache.EtaCache()
+    cache.put("row", fetched(5 * 60))
+    assert [e.eta_mins for e in cache.get("row").get_etas()] == [6]
+
+def test_older_format(tmp_path):
+    path = tmp_path / "eta_cache.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"row": {'fetched_at': datetime.now().isoformat(), 'etas': [{'eta': 3, 'time': "12:03"}]}}, f)
+    assert etacache.EtaCache(str(path)).get("row") is None
+
+class Fetched(eta.Eta):
+    """ETAs of a row, or the exception fetching them raises"""
+    result = None
+
+    def __init__(self, **row) -> None:
+        super().__init__()
+
+    def _fetch_etas(self) -> dict:
+        if isinstance(self.result, Exception):
+            raise self.result
+        return {'data': self.result}
+
+@pytest.fixture
+def display(make_display, monkeypatch):
+    display = make_display([ROW])
+    monkeypatch.setattr(display, "_details", lambda entry: None)
+    monkeypatch.setattr(eta.Eta, "get_obj", staticmethod(lambda co: Fetched))
+    return display
+
+def test_fetch_row_serves_cache(display, monkeypatch):
+    monkeypatch.setattr(Fetched, "result", etas(datetime.now()))
+    first = display._fetch_row(ROW).eta
+    assert display.etas.has(display.etas.key(ROW))
+
+    monkeypatch.setattr(Fetched, "result", requests.ConnectionError())
+    row = display._fetch_row(ROW)
+    assert isinstance(row.eta, etacache.CachedEta), "network error: the cached ETAs are shown"
+    assert row.eta.data == first.data and not row.eta.stale
+
+    monkeypatch.setattr(Fetched, "result", eta.EndOfService("服務時間已過"))
+    row = display._fetch_row(ROW)
+    assert row.eta.error and row.eta.msg == "服務時間已過", "the answer of the operator is shown"
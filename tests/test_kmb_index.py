@@ -0,0 +1,99 @@
+"""
+KMB ETAs looked up in the (dir, seq) index of the route-wide response, against the linear scan it replaced
+"""
+import copy
+import json
+import os
+import pytest
+import _request as rqst
+from eta import eta
+from conftest import ROOT
+
+FIXTURE = os.path.join(ROOT, "data", "fixtures", "api", "data.etabus.gov.hk", "v1", "transport", "kmb", "route-eta", "1", "1.json")
+
+def reference_parse(data: list, direction: str, stop: int, lang: str) -> list:
+    """the ETAs `Kmb._fetch_etas()` read by scanning the whole response, `(eta, remark, co)` of each"""
+    eta_seq = 1
+    output = []
+    for stops in data:
+        if stops["seq"] == stop and stops["dir"] == direction[0].upper():
+            if stops["eta"] == None:
+                if stops["rmk_" + lang] == "":
+                    raise eta.EndOfService("服務時間已過")
+                else:
+                    raise eta.EndOfService(stops["rmk_" + lang])
+            output.append((stops["eta"], stops["rmk_" + lang], stops["co"]))
+            if eta_seq == 3: break
+            eta_seq += 1
+    if len(output) == 0:
+        raise eta.EmptyDataError
+    return output
+
+def entry(direction: str, seq: int, minute: int | None, rmk: str = "") -> dict:
+    return {'co': "KMB", 'route': "N8", 'dir': direction, 'service_type': 1, 'seq': seq, 
+            'eta': None if minute is None else f"2022-07-05T12:{minute:02}:00+08:00", 
+            'rmk_tc': rmk, 'rmk_en': rmk.upper(), 'data_timestamp': "2022-07-05T11:59:42+08:00"}
+
+def response() -> dict:
+    """a route-wide response with stops of 1 to 4 ETAs, out of service stops and a stop with no ETA"""
+    data = [entry("O", 1, m) for m in (1, 9, 17, 25)]          # 4 ETAs, 3 shown
+    data += [entry("O", 2, 3, "原定班次"), entry("O", 2, 14)]
+    data += [entry("O", 3, None, "最後班次已過"), entry("O", 3, 20)]
+    data += [entry("O", 4, None)]
+    data += [entry("I", 1, m) for m in (2, 12, 22)]
+    data += [entry("I", 3, 5)]                                   # inbound stop 2 has no ETA
+    # the directions interleaved, the ETAs of a stop in order
+    data = sorted(data, key=lambda stops: stops['seq'])
+    return {'generated_timestamp': "2022-07-05T12:00:00+08:00", 'data': data}
+
+def kmb(direction: str, stop: int, lang: str = "tc") -> eta.Eta:
+    return eta.Kmb("n8", direction, stop, "1", lang)
+
+def parsed(_eta: eta.Eta):
+    if _eta.error:
+        return (_eta.error_type, _eta.msg)
+    return [(e.eta_time, e.remark, e.co) for e in _eta.data]
+
+def expected(data: list, direction: str, stop: int, lang: str):
+    try:
+        return [(e[11:16], rmk, co) for e, rmk, co in reference_parse(data, direction, stop, lang)]
+    except eta.EndOfService as e:
+        return ("EndOfService", str(e))
+    except eta.EmptyDataError:
+        return ("EmptyDataError", "沒有數據")
+
+@pytest.mark.parametrize("source", ["synthetic", "recorded"])
+@pytest.mark.parametrize("lang", ["tc", "en"])
+def test_same_as_scan(monkeypatch, source, lang):
+    if source == "recorded":
+        with open(FIXTURE, encoding="utf-8") as f:
+            payload = json.load(f)
+    else:
+        payload = response()
+    monkeypatch.setattr(rqst, "kmb_eta", lambda *args, **kwargs: copy.deepcopy(payload))
+    for direction in ("outbound", "inbound"):
+        for stop in range(0, 42):
+            assert parsed(eta.Kmb("1" if source == "recorded" else "n8", direction, stop, "1", lang)) == \
+                expected(payload['data'], direction, stop, lang), (direction, stop)
+
+def test_cases(monkeypatch):
+    monkeypatch.setattr(rqst, "kmb_eta", lambda *args, **kwargs: response())
+    assert [e.eta_mins for e in kmb("outbound", 1).data] == [1, 9, 17], "3 ETAs at most"
+    assert [e.remark for e in kmb("outbound", 2).data] == ["原定班次", ""]
+    assert parsed(kmb("outbound", 3)) == ("EndOfService", "最後班次已過")
+    assert parsed(kmb("outbound", 3, "en")) == ("EndOfService", "最後班次已過".upper())
+    assert parsed(kmb("outbound", 4)) == ("EndOfService", "服務時間已過")
+    assert parsed(kmb("inbound", 2)) == ("EmptyDataError", "沒有數據")
+
+def test_index_shared_per_response(monkeypatch):
+    payload = response()
+    monkeypatch.setattr(rqst, "kmb_eta", lambda *args, **kwargs: payload)
+    kmb("outbound", 1)
+    data, index = eta.Kmb._indexes[("N8", "1")]
+    assert data is payload['data']
+    kmb("inbound", 3)
+    assert eta.Kmb._indexes[("N8", "1")][1] is index, "rows on the same response share the index"
+
+    monkeypatch.setattr(rqst, "kmb_eta", lambda *args, **kwargs: response())
+    assert [e.eta_mins for e in kmb("outbound", 2).data] == [3, 14]
+    assert eta.Kmb._indexes[("N8", "1")][1] is not index, "a new response replaces the index"
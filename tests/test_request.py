@@ -0,0 +1,102 @@
+"""
+Coalescing of identical API calls (`_request.coalescing()`)
+"""
+import threading
+import time
+import pytest
+import requests
+import _request as rqst
+
+class Session:
+    """HTTP session answering every GET once `release` is set, or failing with `error`"""
+
+    def __init__(self, error: Exception = None) -> None:
+        self.urls = []
+        self.error = error
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            self.urls.append(url)
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"data": []}'
+        return response
+
+@pytest.fixture
+def session(monkeypatch):
+    session = Session()
+    monkeypatch.setattr(rqst, "session", lambda: session)
+    return session
+
+def concurrently(func, n: int = 4) -> list:
+    """call `func` from `n` threads at once
+
+    Returns:
+        list: threads, and what each call returned or raised once they are joined
+    """
+    results = [None] * n
+    start = threading.Barrier(n)
+    def call(i):
+        start.wait()
+        try:
+            results[i] = func()
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def joined(threads: list, results: list) -> list:
+    for thread in threads:
+        thread.join(5)
+    return results
+
+def test_shared(session):
+    with rqst.coalescing():
+        calls = concurrently(lambda: rqst.kmb_eta("1", 1))
+        # the other callers wait on the one in flight
+        while len(session.urls) == 0:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        session.release.set()
+        results = joined(*calls)
+        assert rqst.kmb_eta("1", 1) is results[0], "later calls in the block too"
+        rqst.kmb_eta("2", 1)
+    assert len(session.urls) == 2
+    assert all(result is results[0] for result in results)
+    assert results[0] == {'data': []}
+
+def test_shared_error(session):
+    session.error = requests.ConnectionError("unreachable")
+    session.release.set()
+    with rqst.coalescing():
+        errors = joined(*concurrently(lambda: rqst.kmb_eta("1", 1)))
+    assert len(session.urls) == 1
+    assert isinstance(errors[0], requests.ConnectionError)
+    assert all(error is errors[0] for error in errors)
+
+def test_not_coalescing(session):
+    session.release.set()
+    results = joined(*concurrently(lambda: rqst.kmb_eta("1", 1)))
+    assert len(session.urls) == 4
+    assert len({id(result) for result in results}) == 4
+
+    with rqst.coalescing():
+        rqst.kmb_eta("1", 1)
+    rqst.kmb_eta("1", 1)
+    assert len(session.urls) == 6, "not merged once the block has ended"
+
+def test_nested(session):
+    session.release.set()
+    with rqst.coalescing():
+        first = rqst.kmb_eta("1", 1)
+        with rqst.coalescing():
+            assert rqst.kmb_eta("1", 1) is first
+        assert rqst.kmb_eta("1", 1) is first, "the inner block does not end the outer one"
+    assert len(session.urls) == 1
@@ -0,0 +1,58 @@
+"""
+Scheduling of the fetches with adaptive polling
+"""
+import threading
+import time
+import pytest
+from display.interface import Row
+
+ROWS = [
+    {'eta_co': "kmb", 'route': "1", 'direction': "outbound", 'service_type': "1", 'stop': 2, 'lang': "tc"},
+    {'eta_co': "kmb", 'route': "2", 'direction': "outbound", 'service_type': "1", 'stop': 5, 'lang': "tc"},
+]
+
+class Failed:
+    """ETAs failed to fetch"""
+    error = True
+
+@pytest.fixture
+def adaptive(make_display):
+    def make(rows: list):
+        display = make_display(rows)
+        display.adaptive = True
+        display.fetch_wait = 0.05
+        return display
+    return make
+
+def test_no_row_does_not_spin(adaptive):
+    display = adaptive([])
+    assert display.fetch() == []
+    assert display.next_wake() - time.monotonic() >= display.poll_soon - 1
+
+def test_rows_in_flight_are_not_due(adaptive, monkeypatch):
+    display = adaptive(ROWS)
+    release = threading.Event()
+    fetched = []
+    def fetch_row(entry):
+        fetched.append(entry['route'])
+        release.wait(5)
+        # failed: the row stays due
+    monkeypatch.setattr(display, "_fetch_row", fetch_row)
+    monkeypatch.setattr(display, "_details", lambda entry: None)
+    # shown before, so the refresh is not waited for
+    for entry in ROWS:
+        display._rows[display.etas.key(entry)] = Row(None, Failed())
+
+    display.fetch()
+    assert display._fetching == {display.etas.key(entry) for entry in ROWS}
+    assert display.next_wake() - time.monotonic() >= display.poll_soon - 1, "slow refresh"
+    display.fetch()
+    assert sorted(fetched) == ["1", "2"], "not fetched again while in flight"
+
+    release.set()
+    display._refresh.result(5)
+    assert display._fetching == set()
+    assert display.next_wake() - time.monotonic() >= display.poll_soon - 1, "rows failing to fetch"
+    display.fetch()
+    display._refresh.result(5)
+    assert sorted(fetched) == ["1", "1", "2", "2"]
@@ -0,0 +1,62 @@
+"""
+Text render cache, against ImageDraw.text()
+"""
+import pytest
+from PIL import Image, ImageDraw
+from conftest import epd3in7_display
+from src.log.metrics import metrics
+
+# text drawn with each font of the layouts, and the layout key of its x position
+TEXTS = {
+    'f_time': ([f"{h:02}:{m:02}" for h in range(24) for m in range(60)] + ["----", "--"], 'timex'),
+    'f_mins': ([str(m) for m in range(121)], 'etax'),
+    'f_min': (["分", "min"], 'minx'),
+    'f_lmins': (["即將抵達", "Arriving", "-"], 'lminx'),
+    'f_text': (["沒有數據", "網絡錯誤", "API 錯誤"], None),
+    'f_route': (["1A", "K12", "TKL", "N269"], None),
+}
+
+@pytest.fixture(scope="module")
+def display(tmp_path_factory):
+    return epd3in7_display(str(tmp_path_factory.mktemp("root")))
+
+@pytest.mark.parametrize("mode", ['1', 'L'])
+@pytest.mark.parametrize("size", [1, 2, 3])
+@pytest.mark.parametrize("name", TEXTS)
+def test_same_as_imagedraw(display, mode, size, name):
+    display.lyo = display.LAYOUT[size]
+    try:
+        font = getattr(display, name)
+    except OSError:
+        pytest.skip(f"font of {name} is not installed")
+    texts, x = TEXTS[name]
+    xy = (display.lyo[x] if x else 170, 25)
+    for text in texts:
+        display.img = Image.new(mode, (display.epd_width, display.epd_height), 255)
+        display.text(xy, text, fill=0, font=font)
+        expected = Image.new(mode, display.img.size, 255)
+        ImageDraw.Draw(expected).text(xy, text, fill=0, font=font)
+        assert display.img.tobytes() == expected.tobytes(), text
+
+def test_lru(display):
+    font = ImageDraw.ImageDraw(Image.new('1', (1, 1))).getfont()
+    cache = type(display.texts)(maxsize=2)
+    first = cache.get("1", font, '1')
+    assert cache.get("1", font, '1') is first
+    cache.get("2", font, '1')
+    cache.get("3", font, '1')
+    assert cache.get("1", font, '1') is not first
+    assert (cache.hits, cache.misses) == (1, 4)
+
+def test_counted(display):
+    def count(result: str) -> float:
+        prefix = f'eta_station_text_cache_total{{result="{result}"}} '
+        return next((float(line[len(prefix):]) for line in metrics.exposition().splitlines() if line.startswith(prefix)), 0)
+    font = ImageDraw.ImageDraw(Image.new('1', (1, 1))).getfont()
+    cache = type(display.texts)()
+    hits, misses = count("hit"), count("miss")
+    cache.get("1", font, '1')
+    cache.get("1", font, '1')
+    cache.clear()
+    cache.get("1", font, '1')
+    assert (count("hit") - hits, count("miss") - misses) == (1, 2), "counted on lookup, not reset with the cache"